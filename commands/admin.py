@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+
+"""Administration commands."""
+
+from functools import partial
+import time
+
+from evennia.utils.ansi import raw
+
+from commands.command import Command
+from world.deploy import DEPLOYMENT, DeployError
+from world.log import get_levels, set_level
+from world.logquery import parse_period, query
+from world.metrics import get_counters, get_histograms
+from world.profiler import PROFILE_DURATION, PROFILE_RATE, PROFILER
+from world.querywatch import QUERY_BUDGET, QUERY_DEBUG, reports
+from world.render import RENDER
+from world.scheduler import INPUT
+
+class AdminCommand(Command):
+
+    """
+    Base class for administration commands.
+
+    Administration commands accept switches (`stats/reset`): they are
+    stored in `self.switches`, the remaining arguments in `self.args`.
+
+    """
+
+    locks = "cmd:perm(Admin)"
+    help_category = "Admin"
+
+    def parse(self):
+        """Parse the switches."""
+        args = self.args.strip()
+        self.switches = []
+        if args.startswith("/"):
+            switches, _, args = args[1:].partition(" ")
+            self.switches = [switch.lower() for switch in switches.split("/") if switch]
+
+        self.args = args.strip()
+
+
+class CmdStats(AdminCommand):
+
+    """
+    Affiche les statistiques du serveur.
+
+    Syntaxe :
+        stats [commande]
+        stats/queries [commande]
+        stats/input
+        stats/output
+        stats/reset
+
+    Affiche le temps d'exécution des commandes : pour chaque commande, le
+    nombre d'exécutions, la médiane (p50), le 99e centile (p99) et le maximum
+    du temps réel, ainsi que la médiane et le 99e centile du temps CPU. Les
+    temps sont en millisecondes. Précisez le début du nom d'une commande pour
+    ne voir qu'elle. L'option /reset efface les statistiques.
+
+    L'option /queries affiche les requêtes à la base de données par commande
+    et par étape de menu : le nombre d'exécutions, la moyenne et le maximum
+    de requêtes, leur temps moyen et le nombre d'exécutions signalées (budget
+    dépassé ou même requête répétée). Les requêtes ne sont comptées que si
+    QUERY_DEBUG est activé dans la configuration.
+
+    L'option /input affiche la file des commandes en attente : le nombre de
+    commandes en attente (actuel et maximum), le temps d'attente et le nombre
+    de sessions ralenties ou de commandes ignorées.
+
+    L'option /output affiche le nombre de messages envoyés, regroupés par
+    tour du serveur, et l'efficacité du cache de rendu des textes (les textes
+    déjà rendus pour le même type de client ne sont pas analysés à nouveau).
+
+    Exemples :
+        stats
+        stats say
+
+    """
+
+    key = "stats"
+    aliases = ["@stats"]
+
+    def func(self):
+        """Command body."""
+        walls = get_histograms("command_wall_seconds")
+        cpus = dict((histogram.labels["command"], histogram)
+                for histogram in get_histograms("command_cpu_seconds"))
+
+        if "queries" in self.switches:
+            self.show_queries()
+            return
+
+        if "input" in self.switches:
+            self.show_input()
+            return
+
+        if "output" in self.switches:
+            self.show_output()
+            return
+
+        if "reset" in self.switches:
+            for histogram in walls + list(cpus.values()):
+                histogram.reset()
+            reports.clear()
+            self.msg("Les statistiques des commandes ont été effacées.")
+            return
+
+        if self.args:
+            walls = [histogram for histogram in walls
+                    if histogram.labels["command"].startswith(self.args.lower())]
+
+        walls = [histogram for histogram in walls if histogram.count]
+        if not walls:
+            self.msg("Aucune commande n'a été enregistrée.")
+            return
+
+        walls.sort(key=lambda histogram: histogram.count, reverse=True)
+        lines = ["{:<15} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+                "Commande", "Nombre", "p50", "p99", "max", "CPU p50", "CPU p99")]
+        for wall in walls:
+            key = wall.labels["command"]
+            cpu = cpus.get(key)
+            lines.append("{:<15} {:>8} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+                    key[:15], wall.count, wall.percentile(50) * 1000,
+                    wall.percentile(99) * 1000, wall.max * 1000,
+                    cpu.percentile(50) * 1000 if cpu else 0,
+                    cpu.percentile(99) * 1000 if cpu else 0))
+
+        self.msg("\n".join(lines))
+
+    def show_queries(self):
+        """Show the database queries by command."""
+        shown = [report for label, report in sorted(reports.items())
+                if label.startswith(self.args.lower())]
+        if not shown:
+            if QUERY_DEBUG:
+                self.msg("Aucune requête n'a été enregistrée.")
+            else:
+                self.msg("Les requêtes ne sont pas comptées (QUERY_DEBUG est désactivé).")
+            return
+
+        shown.sort(key=lambda report: report.queries, reverse=True)
+        lines = ["Budget : {} requêtes par commande.".format(QUERY_BUDGET)]
+        lines.append("{:<20} {:>8} {:>8} {:>6} {:>9} {:>8}".format(
+                "Commande", "Nombre", "Moyenne", "Max", "Temps", "Alertes"))
+        for report in shown:
+            lines.append("{:<20} {:>8} {:>8.1f} {:>6} {:>9.1f} {:>8}".format(
+                    report.label[:20], report.runs, float(report.queries) / report.runs,
+                    report.max, report.time * 1000 / report.runs, report.flagged))
+            for shape, number in report.fingerprints:
+                lines.append("    {}x {}".format(number, shape[:70]))
+
+        self.msg("\n".join(lines))
+
+    def show_input(self):
+        """Show the state of the input scheduler."""
+        depth = INPUT.depth
+        wait = INPUT.wait
+        lines = [
+            "Commandes en attente : {} (maximum {})".format(depth.value, depth.max),
+            "Attente : {} commandes, p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms".format(
+                    wait.count, wait.percentile(50) * 1000,
+                    wait.percentile(99) * 1000, wait.max * 1000),
+            "Sessions ralenties : {} (actuellement {})".format(
+                    INPUT.throttled_sessions.value, len(INPUT.throttled)),
+            "Commandes ignorées : {}".format(INPUT.dropped.value),
+        ]
+        self.msg("\n".join(lines))
+
+    def show_output(self):
+        """Show the output coalescing and render cache counters."""
+        frames = sum(counter.value for counter in get_counters("output_frames"))
+        coalesced = sum(counter.value for counter in get_counters("output_coalesced"))
+        hits, misses = RENDER.hits.value, RENDER.misses.value
+        ratio = 100.0 * hits / (hits + misses) if hits + misses else 0
+        lines = [
+            "Envois regroupés : {} ({} messages fusionnés)".format(frames, coalesced),
+            "Cache de rendu : {} textes sur {}, {} succès, {} échecs ({:.1f}%)".format(
+                    len(RENDER), RENDER.size, hits, misses, ratio),
+        ]
+        self.msg("\n".join(lines))
+
+
+class CmdLogs(AdminCommand):
+
+    """
+    Recherche dans les journaux du serveur.
+
+    Syntaxe :
+        logs <journal> [durée] [champ=valeur ...] [mots ...]
+        logs/level [<journal> <niveau>]
+
+    Affiche les dernières entrées d'un journal (comme 'main' ou 'login')
+    pendant une durée (par défaut, la dernière heure). La durée est un nombre
+    suivi de s (secondes), m (minutes), h (heures) ou j (jours). Les filtres
+    champ=valeur ne gardent que les entrées dont le champ a cette valeur :
+    le niveau (level) pour tous les journaux, les autres champs (account,
+    character, session, command) seulement si les journaux sont écrits en
+    JSON (LOG_FORMAT dans la configuration). Les autres mots doivent se
+    trouver dans l'entrée.
+
+    Exemples :
+        logs login 1h level=error
+        logs main 30m account=kredh
+        logs main 2j timeout
+
+    L'option /level affiche le niveau de chaque journal, ou change le niveau
+    d'un journal jusqu'au prochain redémarrage (DEBUG, INFO, WARNING, ERROR
+    ou CRITICAL). Les messages de débogage restent limités en nombre par
+    seconde, pour ne pas remplir le disque.
+
+    Exemples :
+        logs/level
+        logs/level command debug
+
+    """
+
+    key = "logs"
+    aliases = ["@logs"]
+    limit = 50
+
+    def func(self):
+        """Command body."""
+        if "level" in self.switches:
+            self.change_level()
+            return
+
+        words = self.args.split()
+        if not words:
+            self.msg("Précisez le nom du journal à consulter.")
+            return
+
+        name = words.pop(0)
+        seconds = 3600
+        if words and parse_period(words[0]) is not None:
+            seconds = parse_period(words.pop(0))
+
+        try:
+            entries = query(name, time.time() - seconds, filters=words, limit=self.limit)
+        except KeyError:
+            self.msg("Le journal {} n'existe pas.".format(name))
+            return
+
+        if not entries:
+            self.msg("Aucune entrée ne correspond dans le journal {}.".format(name))
+            return
+
+        lines = [line for entry in entries for line in entry]
+        self.msg("{} dernières entrées du journal {} :".format(len(entries), name))
+        self.msg(raw(u"\n".join(lines)))
+
+    def change_level(self):
+        """Show or change the level of the loggers."""
+        words = self.args.split()
+        if not words:
+            lines = ["{:<15} {}".format(name, level)
+                    for name, level in sorted(get_levels().items())]
+            self.msg("Niveau des journaux :\n" + "\n".join(lines))
+            return
+
+        if len(words) != 2:
+            self.msg("Syntaxe : logs/level <journal> <niveau>")
+            return
+
+        name, level = words
+        try:
+            set_level(name, level)
+        except KeyError:
+            self.msg("Le journal {} n'existe pas.".format(name))
+        except ValueError:
+            self.msg("Le niveau {} n'est pas valide.".format(level))
+        else:
+            self.msg("Le journal {} est maintenant au niveau {}.".format(name, level.upper()))
+
+
+class CmdProfile(AdminCommand):
+
+    """
+    Profile le serveur en cours d'exécution.
+
+    Syntaxe :
+        profile [durée] [fréquence]
+        profile/stop
+
+    Relève la pile d'appels du serveur plusieurs fois par seconde pendant
+    une durée en secondes (par défaut 30 secondes, 100 fois par seconde),
+    sans trop le ralentir. À la fin, les piles sont écrites dans
+    server/logs/profile-<date>.folded, au format des outils de flamegraph,
+    et un résumé affiche les fonctions du jeu (commandes, typeclasses,
+    world, web) présentes dans le plus de relevés. L'option /stop arrête le
+    profil en cours plus tôt.
+
+    Exemples :
+        profile
+        profile 10 200
+
+    """
+
+    key = "profile"
+    aliases = ["@profile"]
+
+    def func(self):
+        """Command body."""
+        if "stop" in self.switches:
+            if PROFILER.running:
+                PROFILER.stop()
+                self.msg("Le profil en cours va s'arrêter.")
+            else:
+                self.msg("Aucun profil n'est en cours.")
+            return
+
+        try:
+            numbers = [float(word) for word in self.args.split()]
+        except ValueError:
+            self.msg("Précisez une durée et une fréquence en nombres.")
+            return
+
+        duration = numbers[0] if numbers else PROFILE_DURATION
+        rate = numbers[1] if len(numbers) > 1 else PROFILE_RATE
+        if not 0 < duration <= 600 or not 0 < rate <= 1000:
+            self.msg("La durée doit être entre 0 et 600 secondes, la fréquence "
+                    "entre 0 et 1000 relevés par seconde.")
+            return
+
+        if not PROFILER.start(duration, rate, callback=partial(self.show_summary, self.caller)):
+            self.msg("Un profil est déjà en cours.")
+            return
+
+        self.msg("Profil du serveur pendant {:g} secondes ({:g} relevés par seconde).".format(
+                duration, rate))
+
+    def show_summary(self, caller, profiler):
+        """Show the summary of a profile when it's done."""
+        lines = ["Profil terminé : {} relevés écrits dans {}.".format(
+                profiler.samples, profiler.path)]
+        for name, number, percent in profiler.summary():
+            lines.append("{:>6.1f}% {:>6} {}".format(percent, number, name))
+
+        caller.msg("\n".join(lines))
+
+
+class CmdDeploy(AdminCommand):
+
+    """
+    Déploie le nouveau code et redémarre le serveur.
+
+    Syntaxe :
+        deploy [raison]
+
+    Récupère le nouveau code (git fetch), le prépare dans un répertoire à
+    part, y compile les modules modifiés puis redémarre le serveur. Le code
+    du jeu n'est remplacé (seulement en avance rapide) qu'au moment du
+    redémarrage, et les joueurs ne sont déconnectés que pendant celui-ci.
+    Si une étape échoue, le code du jeu ne change pas et le serveur ne
+    redémarre pas. Si le code est déjà à jour, le serveur ne redémarre pas
+    (utilisez @reload).
+
+    Exemple :
+        deploy correction des canaux
+
+    """
+
+    key = "deploy"
+    aliases = ["@deploy"]
+    locks = "cmd:perm(Developer)"
+
+    def func(self):
+        """Command body."""
+        caller = self.caller
+        if DEPLOYMENT.running:
+            self.msg("Un déploiement est déjà en cours.")
+            return
+
+        self.msg("Récupération du nouveau code...")
+        deferred = DEPLOYMENT.run(notify=caller.msg, reason=self.args)
+        deferred.addErrback(self.show_error, caller)
+
+    def show_error(self, failure, caller):
+        """Report a failed deployment."""
+        if failure.check(DeployError):
+            caller.msg("|rDéploiement annulé : {}|n".format(failure.value))
+        else:
+            caller.msg("|rDéploiement annulé : erreur inattendue.|n")
+            return failure
@@ -5,8 +5,19 @@ Commands describe the input the account can do to the game.
 
 """
 
+import time
+
+from django.conf import settings
 from evennia import Command as BaseCommand
 
+from world.log import command as log
+from world.metrics import histogram
+from world.querywatch import watch_queries
+
+## Constants
+COMMAND_SLOW_THRESHOLD = getattr(settings, "COMMAND_SLOW_THRESHOLD", 0.5)
+
+_cpu_time = getattr(time, "process_time", time.clock)
 
 class Command(BaseCommand):
     """
@@ -27,8 +38,44 @@ class Command(BaseCommand):
         - at_post_cmd(): Extra actions, often things done after
             every command, like prompts.
 
+    The wall and CPU time of every command are recorded by key in
+    histograms (see `world.metrics` and the `stats` command).  Commands
+    taking longer than `COMMAND_SLOW_THRESHOLD` seconds are logged in
+    the 'command' logger.  When `QUERY_DEBUG` is set, their database
+    queries are also counted (see `world.querywatch`).  Commands
+    overriding `at_pre_cmd` or `at_post_cmd` should call the parent
+    method.
+
     """
-    pass
+
+    def at_pre_cmd(self):
+        """Record the time before the command runs."""
+        self._started = (time.time(), _cpu_time())
+        self._queries = watch_queries(self.key)
+
+    def at_post_cmd(self):
+        """Record the time taken by the command."""
+        queries = getattr(self, "_queries", None)
+        if queries is not None:
+            self._queries = None
+            queries.stop()
+
+        started = getattr(self, "_started", None)
+        if started is None:
+            return
+
+        wall = time.time() - started[0]
+        cpu = _cpu_time() - started[1]
+        self._started = None
+        key = self.key
+        histogram("command_wall_seconds", "Wall time of commands", command=key).record(wall)
+        histogram("command_cpu_seconds", "CPU time of commands", command=key).record(cpu)
+        if wall >= COMMAND_SLOW_THRESHOLD:
+            log.warning("Slow command {!r} ({:.3f}s, {:.3f}s CPU) by {}: {!r}".format(
+                    key, wall, cpu, self.caller, self.raw_string), extra={
+                    "account": self.account, "character": self.caller,
+                    "session": self.session and self.session.sessid,
+                    "command": key, "duration": round(wall, 3)})
 
 # -------------------------------------------------------------
 #
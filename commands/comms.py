@@ -11,6 +11,9 @@ added into the CharacterCmdSet.
 
 """
 
+from datetime import datetime, timedelta
+import time
+
 from django.utils.translation import ugettext as _
 from evennia import SESSION_HANDLER
 from evennia.commands.default.muxcommand import MuxCommand
@@ -18,10 +21,13 @@ from evennia.comms.channelhandler import CHANNELHANDLER
 from evennia.comms.models import ChannelDB
 from evennia.locks.lockhandler import LockException
 from evennia.utils import evtable
-from evennia.utils.logger import tail_log_file
 from evennia.utils.search import search_channel
 
 from commands.command import Command
+from world.throttle import CHANNELS
+
+# Constants
+ARCHIVE_MAX_LINES = 200
 
 class ChannelCommand(Command):
     """
@@ -94,8 +100,14 @@ class ChannelCommand(Command):
         """
         channelkey, msg = self.args
         caller = self.caller
+
+        # Check the throttle before anything else
+        if msg and self.switch in (None, "me", "emit") and not CHANNELS.allow(caller, channelkey):
+            self.msg("|rVous envoyez trop de messages sur ce canal, patientez un peu.|n")
+            return
+
         channel = ChannelDB.objects.get_channel(channelkey)
-        admin_switches = ("destroy", "emit", "lock", "locks", "desc", "kick")
+        admin_switches = ("destroy", "emit", "lock", "locks", "desc", "kick", "archive", "throttle")
 
         # Check that the channel exist
         if not channel:
@@ -176,12 +188,15 @@ class ChannelCommand(Command):
                     channel.disconnect(to_kick)
                     channel.msg("{} has been kicked from the channel.".format(to_kick.key))
                     to_kick.msg("You have been kicked from the {} channel.".format(channel.key))
+            elif self.switch == "archive":
+                self.show_archive(channel, msg)
+            elif self.switch == "throttle":
+                self.edit_throttle(channel, msg)
         elif self.history_start is not None:
             # Try to view history
-            log_file = channel.attributes.get("log_file", default="channel_%s.log" % channel.key)
-            send_msg = lambda lines: self.msg("".join(line.split("[-]", 1)[1]
-                                                    if "[-]" in line else line for line in lines))
-            tail_log_file(log_file, self.history_start, 20, callback=send_msg)
+            lines = channel.get_log().tail(20, self.history_start)
+            self.msg("\n".join(line.split("[-]", 1)[1].strip()
+                    if "[-]" in line else line for line in lines))
         elif self.switch:
             self.msg("{}: Switch invalide {}.".format(channel.key, self.switch))
         elif not msg:
@@ -193,6 +208,96 @@ class ChannelCommand(Command):
                 return
             channel.msg(msg, senders=self.caller, online=True)
 
+    def show_archive(self, channel, period):
+        """
+        Display the channel messages of a given period.
+
+        Args:
+            channel (Channel): the channel.
+            period (str): the period, as '<date> <start> [end]', like
+                    '2018-11-04 20:00 21:00'.  If the end isn't
+                    specified, display one hour.
+
+        Only the log segments and blocks of this period are decompressed.
+
+        """
+        words = period.split()
+        if len(words) not in (2, 3):
+            self.msg("Specify a date and hours, like: {}/archive 2018-11-04 20:00 21:00".format(
+                    channel.key.lower()))
+            return
+
+        try:
+            start = datetime.strptime(" ".join(words[:2]), "%Y-%m-%d %H:%M")
+            end = start + timedelta(hours=1)
+            if len(words) == 3:
+                end = datetime.strptime(words[0] + " " + words[2], "%Y-%m-%d %H:%M")
+                if end <= start:
+                    end += timedelta(days=1)
+        except ValueError:
+            self.msg("Invalid date or hour: {}.".format(period))
+            return
+
+        lines = channel.get_log().read(time.mktime(start.timetuple()),
+                time.mktime(end.timetuple()))
+        if not lines:
+            self.msg("No message in {} for this period.".format(channel.key))
+            return
+
+        string = "Messages of {} from {} to {}:\n".format(channel.key,
+                start.strftime("%Y-%m-%d %H:%M"), end.strftime("%Y-%m-%d %H:%M"))
+        string += "\n".join(lines[:ARCHIVE_MAX_LINES])
+        if len(lines) > ARCHIVE_MAX_LINES:
+            string += "\n({} more lines, narrow the period to see them.)".format(
+                    len(lines) - ARCHIVE_MAX_LINES)
+
+        self.msg(string)
+
+    def edit_throttle(self, channel, limits):
+        """
+        Display or change the rate limits of a channel.
+
+        Args:
+            channel (Channel): the channel.
+            limits (str): the new limits, as '<speaker rate> <speaker burst>
+                    [<channel rate> <channel burst>]', rates being in
+                    messages per minute, or 'default' to restore the
+                    default limits.  If empty, only display the limits.
+
+        """
+        if limits:
+            current = CHANNELS.get_limits(channel.key)
+            if limits.strip().lower() == "default":
+                limits = None
+            else:
+                try:
+                    limits = [int(number) for number in limits.split()]
+                    assert len(limits) in (2, 4)
+                    assert all(number > 0 for number in limits)
+                except (ValueError, AssertionError):
+                    self.msg("Specify positive numbers: <speaker rate> <speaker burst> "
+                            "[<channel rate> <channel burst>].")
+                    return
+
+                limits = tuple(limits) + tuple(current[len(limits):])
+
+            CHANNELS.configure(channel.key, limits)
+            if limits is None:
+                channel.attributes.remove("throttle")
+            else:
+                channel.db.throttle = limits
+            self.msg("Channel rate limits were edited.")
+
+        limits = CHANNELS.get_limits(channel.key)
+        throttled = dict((scope, CHANNELS.get_counter(channel.key.lower(), scope).value)
+                for scope in ("speaker", "channel"))
+        string = "Rate limits on {}:\n".format(channel.key)
+        string += "  Per speaker: {} messages per minute, burst of {} ({} throttled)\n".format(
+                limits[0], limits[1], throttled["speaker"])
+        string += "  Whole channel: {} messages per minute, burst of {} ({} throttled)".format(
+                limits[2], limits[3], throttled["channel"])
+        self.msg(string)
+
     def get_extra_info(self, caller, **kwargs):
         """
         Let users know that this command is for communicating on a channel.
@@ -240,4 +345,9 @@ HELP_COMM_ADMIN = r"""
       {lower_channelkey}/lock [lockstring]: see or change the channel permissions.
       {lower_channelkey}/emit <message>: admin emit to the channel.
       {lower_channelkey}/destroy: destroy the channel.
+      {lower_channelkey}/archive <date> <start> [end]: see the messages of a period,
+          like {lower_channelkey}/archive 2018-11-04 20:00 21:00.
+      {lower_channelkey}/throttle [limits]: see or change the rate limits, as
+          <speaker rate> <speaker burst> [<channel rate> <channel burst>]
+          (rates in messages per minute), or default.
 """
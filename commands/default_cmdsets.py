@@ -14,13 +14,59 @@ own cmdsets by inheriting from them or directly from `evennia.CmdSet`.
 
 """
 
+from copy import copy
+
 from evennia import default_cmds
 from evennia.commands.default import account
 
-
+from commands.admin import CmdDeploy, CmdLogs, CmdProfile, CmdStats
 from commands.general import CmdAfk, CmdEmote, CmdSay, CmdTell, CmdWho
 
-class CharacterCmdSet(default_cmds.CharacterCmdSet):
+# Commands of the cached cmdsets, by class
+_built = {}
+
+class CachedCmdSet(object):
+
+    """
+    Mixin building the commands of a cmdset once per class.
+
+    The first cmdset of a class is populated by `populate`, which
+    adds and removes commands as `at_cmdset_creation` usually does.
+    The resulting commands are kept, and the next cmdsets of the
+    class receive shallow copies of them, bound to their own object.
+    Commands are thus instantiated once, not on every login, and each
+    cmdset still has its own instances: the command parser and the
+    commands themselves can set attributes on them.
+
+    Copies share the attributes of the first commands (locks, aliases),
+    so they should be changed by replacing them, not in place.
+
+    """
+
+    def at_cmdset_creation(self):
+        """Populate the cmdset, from the cache if possible."""
+        cls = type(self)
+        built = _built.get(cls)
+        if built is None:
+            self.populate()
+            built = _built[cls] = (list(self.commands), list(self.system_commands))
+
+        commands, system_commands = built
+        self.commands = [self.share(cmd) for cmd in commands]
+        self.system_commands = [self.share(cmd) for cmd in system_commands]
+
+    def share(self, cmd):
+        """Return a copy of a cached command, bound to this cmdset's object."""
+        cmd = copy(cmd)
+        cmd.obj = self.cmdsetobj
+        return cmd
+
+    def populate(self):
+        """Add and remove the commands of the cmdset."""
+        pass
+
+
+class CharacterCmdSet(CachedCmdSet, default_cmds.CharacterCmdSet):
     """
     The `CharacterCmdSet` contains general in-game commands like `look`,
     `get`, etc available on in-game Character objects. It is merged with
@@ -28,11 +74,11 @@ class CharacterCmdSet(default_cmds.CharacterCmdSet):
     """
     key = "DefaultCharacter"
 
-    def at_cmdset_creation(self):
+    def populate(self):
         """
         Populates the cmdset
         """
-        super(CharacterCmdSet, self).at_cmdset_creation()
+        default_cmds.CharacterCmdSet.at_cmdset_creation(self)
         self.remove(default_cmds.CmdDrop())
         self.remove(default_cmds.CmdGet())
         self.remove(default_cmds.CmdGive())
@@ -55,8 +101,14 @@ class CharacterCmdSet(default_cmds.CharacterCmdSet):
         self.add(CmdTell())
         self.add(CmdWho())
 
+        # Admin commands
+        self.add(CmdDeploy())
+        self.add(CmdLogs())
+        self.add(CmdProfile())
+        self.add(CmdStats())
 
-class AccountCmdSet(default_cmds.AccountCmdSet):
+
+class AccountCmdSet(CachedCmdSet, default_cmds.AccountCmdSet):
     """
     This is the cmdset available to the Account at all times. It is
     combined with the `CharacterCmdSet` when the Account puppets a
@@ -65,11 +117,11 @@ class AccountCmdSet(default_cmds.AccountCmdSet):
     """
     key = "DefaultAccount"
 
-    def at_cmdset_creation(self):
+    def populate(self):
         """
         Populates the cmdset
         """
-        super(AccountCmdSet, self).at_cmdset_creation()
+        default_cmds.AccountCmdSet.at_cmdset_creation(self)
         self.remove(default_cmds.CmdPage())
         self.remove(default_cmds.CmdCharCreate())
         self.remove(account.CmdCharDelete())
@@ -2,11 +2,11 @@
 
 """General commands."""
 
-from evennia import AccountDB
-from evennia.server.sessionhandler import SESSIONS
 from evennia.utils.ansi import raw
 
 from commands.command import Command
+from world.directory import DIRECTORY
+from world.presence import ROSTER
 
 class CmdAfk(Command):
 
@@ -17,7 +17,8 @@ class CmdAfk(Command):
         afk [message]
 
     Passe AFK, précisant un message optionnel. Entrez la commande sans argument pour
-    quitter l'AFK.
+    quitter l'AFK. Après un moment d'inactivité, vous passez automatiquement AFK,
+    jusqu'à ce que vous entriez une nouvelle commande.
 
     Exemple :
         afk jusqu'à 20h
@@ -34,6 +35,7 @@ class CmdAfk(Command):
 
         if caller.db.afk:
             del caller.db.afk
+            ROSTER.set_afk(caller, None)
             self.msg("|gVous n'êtes plus AFK.|n")
         else:
             if message:
@@ -41,6 +43,7 @@ class CmdAfk(Command):
             else:
                 self.msg("|gVous passez AFK.")
             caller.db.afk = message or True
+            ROSTER.set_afk(caller, message or True)
 
 
 class CmdEmote(Command):
@@ -113,10 +116,13 @@ class CmdTell(Command):
 
     Dit quelque chose sans contrainte RP et sans que les autres ne voient le
     message. Précisez en premier paramètre le nom du joueur sans espace, et en
-    second paramètre le message à lui envoyer.
+    second paramètre le message à lui envoyer. Le nom peut être celui de
+    l'utilisateur ou de son personnage, sans tenir compte des accents, et
+    peut être abrégé s'il n'y a pas d'ambiguïté.
 
     Exemple :
         tell Kredh Cela marche
+        tell kre Cela marche aussi
 
     """
 
@@ -136,12 +142,16 @@ class CmdTell(Command):
             return
 
         name, message = message.split(" ", 1)
-        try:
-            account = AccountDB.objects.get(username__iexact=name)
-        except AccountDB.DoesNotExist:
-            self.msg("|rL'utilisateur {} n'existe pas.".format(name))
+        accounts = DIRECTORY.search(name)
+        if not accounts:
+            self.msg("|rAucun joueur connecté ne correspond à {}.|n".format(name))
+            return
+        elif len(accounts) > 1:
+            self.msg("|rPlusieurs joueurs correspondent à {} : {}.|n".format(name,
+                    ", ".join(sorted(account.username for account in accounts))))
             return
 
+        account = accounts[0]
         self.msg("Vous dites à {} : {}".format(account.username, message))
         account.msg("{} vous dit : {}".format(caller.account.username, message))
 
@@ -161,23 +171,4 @@ class CmdWho(Command):
 
     def func(self):
         """Command body."""
-        sessions = list(SESSIONS.get_sessions())
-        sessions = [session for session in sessions if session.puppet]
-        sessions.sort(key=lambda session: session.puppet.key)
-
-        lines = []
-        for session in sessions:
-            puppet = session.puppet
-            afk = ""
-            if puppet.db.afk:
-                afk = "AFK"
-                if isinstance(puppet.db.afk, basestring):
-                    afk += " (" + puppet.db.afk + ")"
-
-            lines.append("|   {:<15} {:<55} |".format(puppet.key, afk))
-
-        lines.insert(0, "+" + "-" * 75 + "+")
-        lines.append("+" + "-" * 75 + "+")
-        lines.append("|   " + "{} utilisateur{s} connecté{s}".format(len(sessions), s="s" if len(sessions) > 1 else "").ljust(72) + " |")
-        lines.append("+" + "-" * 75 + "+")
-        self.msg("\n".join(lines))
+        self.msg(ROSTER.render())
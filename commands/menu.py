@@ -17,9 +17,9 @@ from evennia import managers
 from evennia import ObjectDB
 from evennia.server.models import ServerConfig
 from evennia import syscmdkeys
-from evennia.utils.evmenu import EvMenu
+from evennia.utils.evmenu import EvMenu as BaseEvMenu
 from evennia.utils.utils import random_string_from_module
-from web.mailgun.utils import send_email
+from world.querywatch import watch_queries
 
 # Constants
 RE_VALID_USERNAME = re.compile(r"^[a-z]{3,}$", re.I)
@@ -97,7 +97,7 @@ def username(caller, string_input):
         caller.ndb._menutree.account = account
         password = _generate_password(6, string.lowercase + string.digits)
         account.set_password(password, force=True)
-        send_email("NOREPLY", account.email, "[VanciaMUD] Demande de récupération de l'utilisateur {}".format(account.username), dedent("""
+        _send_email("NOREPLY", account.email, "[VanciaMUD] Demande de récupération de l'utilisateur {}".format(account.username), dedent("""
                 Bonjour,
 
                 Une demande de récupération de l'utilisateur {username} a été faite depuis vanciamud.fr.
@@ -453,7 +453,7 @@ def create_email_address(caller, email_address):
         # Generates the 4-digit validation code
         validation_code = _generate_password(4, string.digits)
         account.db.validation_code = validation_code
-        send_email("NOREPLY", account.email, "[VanciaMUD] Validation de l'utilisateur {}".format(account.username), dedent("""
+        _send_email("NOREPLY", account.email, "[VanciaMUD] Validation de l'utilisateur {}".format(account.username), dedent("""
                 Bonjour,
 
                 Le nouvel utilisateur {username} a été créé sur vanciamud.fr.
@@ -630,9 +630,33 @@ def _generate_password(length, charset):
     indices = [int(len(charset) * (ord(byte) / 256.0)) for byte in random_bytes]
     return "".join([charset[index] for index in indices])
 
+def _send_email(*args, **kwargs):
+    """
+    Send an email (see `web.mailgun.models.EmailMessage.send`).
+
+    The mail stack is imported the first time an email is sent, not
+    when the menu is loaded.
+
+    """
+    from web.mailgun.utils import send_email
+    return send_email(*args, **kwargs)
+
 
 # Commands and CmdSets
 
+class EvMenu(BaseEvMenu):
+
+    """EvMenu counting the database queries of each node (see `world.querywatch`)."""
+
+    def _execute_node(self, nodename, raw_string, **kwargs):
+        queries = watch_queries("menu:{}".format(nodename))
+        try:
+            return super(EvMenu, self)._execute_node(nodename, raw_string, **kwargs)
+        finally:
+            if queries is not None:
+                queries.stop()
+
+
 class UnloggedinCmdSet(CmdSet):
     "Cmdset for the unloggedin state"
     key = "DefaultUnloggedin"
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the commands.
+
+Run them from the game directory:
+
+    evennia test --settings settings.py commands
+
+"""
+
+from evennia.commands.default.general import CmdLook
+from evennia.commands.default.tests import CommandTest
+from evennia.utils.create import create_object
+
+from commands.general import CmdWho
+from typeclasses.objects import Object
+from world.querywatch import query_budget, reports
+
+
+class TestQueryBudget(CommandTest):
+
+    """
+    The commands stay within their query budget (see `world.querywatch`).
+
+    Each command is run with objects around, so that a query repeated
+    for each of them (N+1) is caught by the budget.  The commands are
+    run once before being watched: the first look at new objects
+    stores their plural names (see `get_numbered_name`).
+
+    """
+
+    def setUp(self):
+        super(TestQueryBudget, self).setUp()
+        for number in range(10):
+            create_object(Object, key="caisse {}".format(number), location=self.room1)
+
+    def test_who(self):
+        self.call(CmdWho(), "")
+        with query_budget(label="who"):
+            self.call(CmdWho(), "")
+
+        self.assertNotIn("who", reports)
+
+    def test_look(self):
+        self.call(CmdLook(), "")
+        with query_budget(label="look"):
+            self.call(CmdLook(), "")
+
+        self.assertNotIn("look", reports)
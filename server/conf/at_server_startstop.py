@@ -16,14 +16,33 @@ at_server_cold_stop()
 
 """
 
-import subprocess
+# Only the server loads this module: time its startup from here
+from world.startup import STARTUP
+STARTUP.start()
+
+from world.attributes import flush_attributes
+from world.deploy import DEPLOYMENT
+from world.log import begin as begin_logs, end as end_logs, main as log
+from world.snapshot import discard_snapshot, restore_snapshot, save_snapshot
+from world.warmup import WARMUP_STAGES, warm_up
 
 def at_server_start():
     """
     This is called every time the server starts up, regardless of
     how it was shut down.
+
+    It's called after `at_server_reload_start` or `at_server_cold_start`,
+    so the startup times are reported here.
     """
-    pass
+    with STARTUP.hook("at_server_start"):
+        begin_logs()
+
+    # Load the working set (the idmapper cache is empty after a reload too)
+    if WARMUP_STAGES:
+        with STARTUP.hook("warm_up"):
+            warm_up()
+
+    STARTUP.report()
 
 
 def at_server_stop():
@@ -31,23 +50,38 @@ def at_server_stop():
     This is called just before the server is shut down, regardless
     of it is for a reload, reset or shutdown.
     """
-    pass
+    try:
+        flush_attributes()
+    finally:
+        end_logs()
 
 
 def at_server_reload_start():
     """
     This is called only when server starts back up after a reload.
     """
-    pass
+    with STARTUP.hook("restore_snapshot"):
+        restore_snapshot()
 
 
 def at_server_reload_stop():
     """
     This is called only time the server stops before a reload.
+
+    The code isn't pulled here anymore: the deploy command fetches and
+    compiles it before reloading, and the game directory is only moved
+    to the new code here (see `world.deploy`).  This hook must not
+    raise, or the server would stop before saving its data.
     """
-    print "Pulling from Github..."
-    process = subprocess.Popen("git pull", shell=True)
-    process.wait()
+    try:
+        save_snapshot()
+    except Exception:
+        log.exception("Snapshot: the caches couldn't be saved")
+
+    try:
+        DEPLOYMENT.switch()
+    except Exception:
+        log.exception("Deploy: the new code couldn't be switched to")
 
 
 def at_server_cold_start():
@@ -55,7 +89,7 @@ def at_server_cold_start():
     This is called only when the server starts "cold", i.e. after a
     shutdown or a reset.
     """
-    pass
+    discard_snapshot()
 
 
 def at_server_cold_stop():
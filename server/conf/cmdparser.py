@@ -1,36 +1,44 @@
 """
-Changing the default command parser
+Command parser indexed by a trie.
 
 The cmdparser is responsible for parsing the raw text inserted by the
 user, identifying which command/commands match and return one or more
 matching command objects. It is called by Evennia's cmdhandler and
-must accept input and return results on the same form. The default
-handler is very generic so you usually don't need to overload this
-unless you have very exotic parsing needs; advanced parsing is best
-done at the Command.parse level.
+must accept input and return results on the same form.
 
-The default cmdparser understands the following command combinations
-(where [] marks optional parts.)
+The default parser compares the input with every key and alias of the
+merged cmdset, including the channel commands and exits.  This one
+indexes the keys and aliases of the merged cmdset in a prefix trie:
+walking the input in the trie finds the matching names in
+O(len(input)).  The cmdhandler keeps the merged cmdsets in a cache and
+gives the same merged cmdset for every input while the cmdsets of the
+caller don't change, so the tries are kept on the merged cmdset, and
+dropped with it.
+
+Otherwise, the parser behaves like the default one:
 
 [cmdname[ cmdname2 cmdname3 ...] [the rest]
 
 A command may consist of any number of space-separated words of any
-length, and contain any character. It may also be empty.
-
-The parser makes use of the cmdset to find command candidates. The
-parser return a list of matches. Each match is a tuple with its first
-three elements being the parsed cmdname (lower case), the remaining
-arguments, and the matched cmdobject from the cmdset.
+length, and contain any character. It may also be empty.  The
+prefixes of `CMD_IGNORE_PREFIXES` are ignored if no command matches
+with them, and `SEARCH_MULTIMATCH_REGEX` selects one of several
+commands of the same name ('2.look').
 
-
-This module is not accessed by default. To tell Evennia to use it
-instead of the default command parser, add the following line to
-your settings file:
+This module is used because of the following line in the settings:
 
     COMMAND_PARSER = "server.conf.cmdparser.cmdparser"
 
 """
 
+import re
+
+from django.conf import settings
+from evennia.utils.logger import log_trace
+
+## Constants
+_MULTIMATCH_REGEX = re.compile(settings.SEARCH_MULTIMATCH_REGEX, re.I + re.U)
+_CMD_IGNORE_PREFIXES = settings.CMD_IGNORE_PREFIXES
 
 def cmdparser(raw_string, cmdset, caller, match_index=None):
     """
@@ -44,12 +52,208 @@ def cmdparser(raw_string, cmdset, caller, match_index=None):
                   list of same-named command matches.
 
     Returns:
-     list of tuples: [(cmdname, args, cmdobj, cmdlen, mratio), ...]
+     list of tuples: [(cmdname, args, cmdobj, cmdlen, mratio, raw_cmdname), ...]
             where cmdname is the matching command name and args is
             everything not included in the cmdname. Cmdobj is the actual
             command instance taken from the cmdset, cmdlen is the length
             of the command name and the mratio is some quality value to
-            (possibly) separate multiple matches.
+            (possibly) separate multiple matches.  raw_cmdname is the
+            command name before the prefixes were stripped.
+
+    """
+    if not raw_string:
+        return []
+
+    index = get_index(cmdset)
+
+    # Find matches, first using the full name
+    matches = index.match(raw_string, include_prefixes=True)
+    if not matches:
+        # Try to match a number 1.cmdname, 2.cmdname etc
+        mindex, new_raw_string = try_num_prefixes(raw_string)
+        if mindex is not None:
+            return cmdparser(new_raw_string, cmdset, caller, match_index=int(mindex))
+
+        if _CMD_IGNORE_PREFIXES:
+            # Still no match, try to strip prefixes
+            raw_string = raw_string.lstrip(_CMD_IGNORE_PREFIXES) if len(raw_string) > 1 else raw_string
+            matches = index.match(raw_string, include_prefixes=False)
+
+    # Only select command matches we are actually allowed to call
+    matches = [match for match in matches if match[2].access(caller, "cmd")]
+
+    # Try to bring the number of matches down to 1
+    if len(matches) > 1:
+        # See if it helps to analyze the match with preserved case,
+        # but only if it leaves at least one match
+        trimmed = [match for match in matches if raw_string.startswith(match[0])]
+        if trimmed:
+            matches = trimmed
+
+    if len(matches) > 1:
+        # Still multiple matches, sort them by count quality
+        matches = sorted(matches, key=lambda match: match[3])
+        quality = [match[3] for match in matches]
+        matches = matches[-quality.count(quality[-1]):]
+
+    if len(matches) > 1:
+        # Still multiple matches, fall back to ratio-based quality
+        matches = sorted(matches, key=lambda match: match[4])
+        quality = [match[4] for match in matches]
+        matches = matches[-quality.count(quality[-1]):]
+
+    if len(matches) > 1 and match_index is not None and 0 < match_index <= len(matches):
+        # Matches couldn't be separated by quality, but the index
+        # argument tells which match to use
+        matches = [matches[match_index - 1]]
+
+    return matches
+
+def get_index(cmdset):
+    """
+    Return the index of the commands of a merged cmdset.
+
+    The index is kept on the cmdset (not in a module cache, as matched
+    commands refer to their merged cmdset and would keep it alive).  It
+    is built again if the list of commands of the cmdset was replaced,
+    or has grown or shrunk, since.
+
+    Args:
+        cmdset (CmdSet): the merged cmdset.
+
+    Returns:
+        index (CommandIndex): the index of the commands.
+
+    """
+    index = getattr(cmdset, "_command_index", None)
+    if index is None or not index.indexes(cmdset.commands):
+        index = cmdset._command_index = CommandIndex(cmdset.commands)
+
+    return index
+
+def try_num_prefixes(raw_string):
+    """
+    Test if the user tries to separate multi-matches with a number
+    separator (default 1.name, 2.name etc).
+
+    Args:
+        raw_string (str): the user input to parse.
+
+    Returns:
+        mindex (str or None): the index, if found.
+        new_raw_string (str or None): the input without the index.
+
+    """
+    num_ref_match = _MULTIMATCH_REGEX.match(raw_string)
+    if num_ref_match:
+        groups = num_ref_match.groupdict()
+        return groups["number"], groups["name"] + (groups.get("args") or "")
+
+    return None, None
+
+def create_match(cmdname, string, cmdobj, raw_cmdname):
+    """
+    Build a match tuple.
+
+    Args:
+        cmdname (str): the name of the command which was matched.
+        string (str): the user input (with prefixes stripped if needed).
+        cmdobj (Command): the matched command.
+        raw_cmdname (str): the name of the command before stripping.
+
+    Returns:
+        match (tuple): (cmdname, args, cmdobj, cmdlen, mratio, raw_cmdname)
+
+    """
+    cmdlen, strlen = len(unicode(cmdname)), len(unicode(string))
+    mratio = 1 - (strlen - cmdlen) / (1.0 * strlen)
+    args = string[cmdlen:]
+    return (cmdname, args, cmdobj, cmdlen, mratio, raw_cmdname)
+
+
+class TrieNode(object):
+
+    """A node of the trie, with the command names ending here."""
+
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []
+
+
+class CommandIndex(object):
 
     """
-    # Your implementation here
+    The command names of a cmdset, indexed in two tries.
+
+    The first trie holds the names as they are, the second the names
+    with the prefixes of `CMD_IGNORE_PREFIXES` stripped.  Each trie is
+    keyed by lowercase characters, and the entries of a node keep the
+    order of the cmdset, so that matches come in the same order as with
+    the default parser.
+
+    """
+
+    def __init__(self, commands):
+        self.commands = commands
+        self.size = len(commands)
+        self.full = TrieNode()
+        self.stripped = TrieNode()
+        for cmd in commands:
+            for raw_cmdname in [cmd.key] + cmd.aliases:
+                if not raw_cmdname:
+                    continue
+
+                self.add(self.full, raw_cmdname, cmd, raw_cmdname)
+                cmdname = raw_cmdname
+                if len(raw_cmdname) > 1:
+                    cmdname = raw_cmdname.lstrip(_CMD_IGNORE_PREFIXES)
+
+                if cmdname:
+                    self.add(self.stripped, cmdname, cmd, raw_cmdname)
+
+    def indexes(self, commands):
+        """Return whether this index is up to date with a list of commands."""
+        return commands is self.commands and len(commands) == self.size
+
+    def add(self, root, cmdname, cmd, raw_cmdname):
+        """Add a command name in a trie."""
+        node = root
+        for char in cmdname.lower():
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = TrieNode()
+            node = child
+
+        node.entries.append((cmdname, cmd, raw_cmdname))
+
+    def match(self, raw_string, include_prefixes=True):
+        """
+        Return the commands whose name begins the input.
+
+        Args:
+            raw_string (str): the user input.
+            include_prefixes (bool, optional): match the names with
+                    their prefixes, or the stripped names.
+
+        Returns:
+            matches (list of tuples): the matches, see `create_match`.
+
+        """
+        matches = []
+        try:
+            l_raw_string = raw_string.lower()
+            node = self.full if include_prefixes else self.stripped
+            for char in l_raw_string:
+                node = node.children.get(char)
+                if node is None:
+                    break
+
+                for cmdname, cmd, raw_cmdname in node.entries:
+                    if not cmd.arg_regex or cmd.arg_regex.match(l_raw_string[len(cmdname):]):
+                        matches.append(create_match(cmdname, raw_string, cmd, raw_cmdname))
+        except Exception:
+            log_trace("cmdhandler error. raw_input:%s" % raw_string)
+
+        return matches
@@ -26,6 +26,61 @@ as argument.
 
 """
 
+from django.conf import settings
+from evennia.server.inputfuncs import text as _text
+
+from world.directory import DIRECTORY
+from world.idle import IDLE
+from world.scheduler import INPUT
+
+## Constants
+IDLE_COMMANDS = (settings.IDLE_COMMAND, "idle")
+
+def text(session, *args, **kwargs):
+    """
+    Main text input from the client.
+
+    This wraps the default `text` input function to record the input
+    time of the puppeted character (see `world.idle`).  Idle commands
+    sent by clients to keep the connection alive are not recorded.
+    Other input goes through the input scheduler, which runs the input
+    of sessions in turn and limits their rate (see `world.scheduler`).
+
+    Args:
+        session (Session): the active Session.
+        args (list): the text input is in args[0].
+
+    """
+    if not args or args[0] is None or args[0].strip() in IDLE_COMMANDS:
+        _text(session, *args, **kwargs)
+        return
+
+    puppet = session.puppet
+    if puppet and args[0]:
+        IDLE.touch(puppet)
+
+    INPUT.submit(session, _text, *args, **kwargs)
+
+def complete_name(session, *args, **kwargs):
+    """
+    Complete the name of a connected player.
+
+    The client sends the beginning of a name and receives the matching
+    account and character names (ignoring case and accents), as a
+    `complete_name` command with the prefix and the list of names.
+
+    Args:
+        session (Session): the active Session.
+        args (list): the prefix is in args[0].
+
+    """
+    if not session.logged_in or not args or not args[0]:
+        return
+
+    prefix = args[0]
+    session.msg(complete_name=((prefix, DIRECTORY.complete(prefix)), {}))
+
+
 # def oob_echo(session, *args, **kwargs):
 #     """
 #     Example echo function. Echoes args, kwargs sent to it.
@@ -14,6 +14,12 @@ services are started last in the Server startup process.
 
 """
 
+from twisted.application.internet import TimerService
+
+from world.attributes import WRITE_BEHIND_INTERVAL, write_behind
+from world.exporter import METRICS_PORT, get_service as get_metrics_service
+from world.idle import IDLE
+from world.watchdog import LAG, LagService
 
 def start_plugin_services(server):
     """
@@ -21,4 +27,23 @@ def start_plugin_services(server):
 
     server - a reference to the main server application.
     """
-    pass
+    # Advance the timer wheel setting idle characters AFK
+    service = TimerService(IDLE.resolution, IDLE.tick)
+    service.setName("AutoAfk")
+    server.services.addService(service)
+
+    # Write the attributes changed in memory
+    service = TimerService(WRITE_BEHIND_INTERVAL, write_behind)
+    service.setName("WriteBehind")
+    server.services.addService(service)
+
+    # Measure the reactor lag and log the stack of blocking calls
+    service = LagService(LAG)
+    service.setName("LagWatchdog")
+    server.services.addService(service)
+
+    # Serve the metrics in the Prometheus format, on localhost
+    if METRICS_PORT:
+        service = get_metrics_service()
+        service.setName("Metrics")
+        server.services.addService(service)
@@ -13,15 +13,82 @@ necessary except for the most custom and exotic designs - and even
 then it might be enough to just add custom session-level commands to
 the SessionCmdSet instead.
 
-This module is not normally called. To tell Evennia to use the class
-in this module instead of the default one, add the following to your
-settings file:
+This module is used because of the following line in the settings:
 
     SERVER_SESSION_CLASS = "server.conf.serversession.ServerSession"
 
+Sessions coalesce their output: plain text sent during a reactor turn
+is buffered and sent to the portal in one frame when the turn ends.
+For telnet clients, the text is also rendered with a cache (see
+`world.render`) and sent raw.
+
 """
 
+from django.conf import settings
 from evennia.server.serversession import ServerSession as BaseServerSession
+from evennia.utils.utils import to_unicode
+from twisted.internet import reactor
+
+from world.metrics import counter
+from world.render import RAW_OPTIONS, RENDER, RENDER_OPTIONS, get_profile
+from world.scheduler import INPUT
+
+## Constants
+OUTPUT_COALESCE = getattr(settings, "OUTPUT_COALESCE", True)
+
+_frames = counter("output_frames", "Coalesced frames sent to the portal")
+_coalesced = counter("output_coalesced", "Messages merged into a previous frame")
+
+def split_text(text):
+    """
+    Split the text of an output in its string and its keywords.
+
+    Args:
+        text (str or tuple): the 'text' argument of `data_out`.
+
+    Returns:
+        text (str or None): the string, or None if it isn't one.
+        keywords (dict): the keywords sent with it, like {'type': 'say'}.
+
+    """
+    keywords = {}
+    if isinstance(text, (tuple, list)):
+        if len(text) == 2 and (isinstance(text[1], dict) or not text[1]):
+            keywords = text[1] or {}
+        elif len(text) != 1:
+            return None, keywords
+
+        text = text[0]
+
+    if not isinstance(text, basestring):
+        return None, keywords
+
+    return text, keywords
+
+def get_plain_text(kwargs):
+    """
+    Return the text of an output, if it can be coalesced.
+
+    Only text without options can be coalesced: prompts, options (like
+    echo control or raw text) and other output functions bypass the
+    buffer.  `Object.msg` and `Account.msg` always send an 'options'
+    keyword, usually None: empty options don't prevent coalescing.
+
+    Args:
+        kwargs (dict): the keyword arguments of `data_out`.
+
+    Returns:
+        text (str or None): the text, or None if it can't be coalesced.
+
+    """
+    if "text" not in kwargs or kwargs.get("options"):
+        return None
+
+    if any(key not in ("text", "options") for key in kwargs):
+        return None
+
+    text, keywords = split_text(kwargs["text"])
+    return None if keywords else text
 
 
 class ServerSession(BaseServerSession):
@@ -32,5 +99,119 @@ class ServerSession(BaseServerSession):
     Each account gets one or more sessions assigned to them whenever they connect
     to the game server. All communication between game and account goes
     through their session(s).
+
+    Plain text is buffered until the end of the reactor turn, so that
+    a command sending several messages sends one frame.  Other output
+    (prompts, options, OOB) flushes the buffer first, to keep the order.
+    Text sent to telnet clients is rendered for their profile, one
+    message at a time, with the render cache, whether it was buffered
+    or not.  Screenreader output is only buffered if it can be rendered
+    here, as its stripping is done on each message.
+
     """
-    pass
+
+    _output = None
+    _output_call = None
+
+    def data_out(self, **kwargs):
+        """
+        Send data from Evennia to the client, coalescing plain text.
+
+        Kwargs:
+            text (str or tuple): the text to send.
+            any (str or tuple): other send commands, or 'options'.
+
+        """
+        text = get_plain_text(kwargs)
+        profile = get_profile(self)
+        if text is None:
+            self.flush_output()
+            if profile is not None:
+                kwargs = self.render_output(kwargs, profile)
+            super(ServerSession, self).data_out(**kwargs)
+            return
+
+        if not OUTPUT_COALESCE or (profile is None and self.protocol_flags.get("SCREENREADER")):
+            self.flush_output()
+            self.send_text([text], profile)
+            return
+
+        if self._output is None:
+            self._output = []
+
+        self._output.append(text)
+        if self._output_call is None:
+            self._output_call = reactor.callLater(0, self.flush_output)
+
+    def flush_output(self):
+        """Send the buffered text in one frame."""
+        if self._output_call is not None:
+            if self._output_call.active():
+                self._output_call.cancel()
+            self._output_call = None
+
+        output = self._output
+        if not output:
+            return
+
+        self._output = None
+        _frames.incr()
+        _coalesced.incr(len(output) - 1)
+        self.send_text(output, get_profile(self))
+
+    def send_text(self, output, profile=None):
+        """
+        Send messages in one frame.
+
+        Args:
+            output (list of str): the messages.
+            profile (tuple, optional): the rendering profile of the
+                    session, if the text can be rendered here.
+
+        """
+        if profile is not None:
+            text = u"\n".join(to_unicode(RENDER.render(line, profile)) for line in output)
+            super(ServerSession, self).data_out(text=text, options=dict(RAW_OPTIONS))
+            return
+
+        if len(output) == 1:
+            text = output[0]
+        else:
+            # Reset the colors at the end of each message, as the protocols do
+            text = u"|n\n".join(to_unicode(line) for line in output)
+
+        super(ServerSession, self).data_out(text=text)
+
+    def render_output(self, kwargs, profile):
+        """
+        Render the text of an output that isn't buffered.
+
+        The text is rendered with the cache and sent raw, with the other
+        send commands, unless its options change its rendering.
+
+        Args:
+            kwargs (dict): the keyword arguments of `data_out`.
+            profile (tuple): the rendering profile of the session.
+
+        Returns:
+            kwargs (dict): the keyword arguments to send.
+
+        """
+        options = kwargs.get("options") or {}
+        if any(option in options for option in RENDER_OPTIONS):
+            return kwargs
+
+        text, keywords = split_text(kwargs.get("text"))
+        if not text:
+            return kwargs
+
+        kwargs = dict(kwargs, options=dict(options, **RAW_OPTIONS))
+        rendered = to_unicode(RENDER.render(text, profile))
+        kwargs["text"] = (rendered, keywords) if keywords else rendered
+        return kwargs
+
+    def at_disconnect(self, reason=None):
+        """Send the buffered text and drop the waiting input before disconnecting."""
+        self.flush_output()
+        INPUT.forget(self)
+        super(ServerSession, self).at_disconnect(reason)
@@ -45,6 +45,9 @@ DELAY_CMD_LOGINSTART = 0
 # Default prefix
 CMD_IGNORE_PREFIXES = "@:"
 
+# Command parser indexing the command names in a trie
+COMMAND_PARSER = "server.conf.cmdparser.cmdparser"
+
 # Default command class
 #COMMAND_DEFAULT_CLASS = "commands.command.MuxCommand"
 
@@ -58,9 +61,89 @@ TIME_GAME_EPOCH = 1577865600
 # Channel options
 #CHANNEL_COMMAND_CLASS = "commands.comms.ChannelCommand"
 
+# Sessions buffering their text output to send one frame per reactor turn
+SERVER_SESSION_CLASS = "server.conf.serversession.ServerSession"
+OUTPUT_COALESCE = True
+
 # Screen reader and accessibility options
 SCREENREADER_REGEX_STRIP = r"\+-+|\+$|\+~|---+|~~+|==+"
 
+# Delay (in seconds) after which inactive characters are set AFK (0 to disable)
+AUTO_AFK_DELAY = 15 * 60
+
+# Commands taking longer than this (in seconds) are logged as slow
+COMMAND_SLOW_THRESHOLD = 0.5
+
+# Format of the log files: "text", or "json" to write JSON lines with
+# fields (account, session, command...) searchable with the logs command
+LOG_FORMAT = "text"
+
+# Level of the loggers (LOG_LEVELS overrides it by logger, like
+# {"command": "DEBUG"}); levels can be changed in game with logs/level.
+# Debug records are limited by call site to LOG_DEBUG_RATE (per second, burst)
+LOG_LEVEL = "DEBUG"
+LOG_LEVELS = {}
+LOG_DEBUG_RATE = (10, 50)
+
+# Reactor lag: a heartbeat runs every LAG_INTERVAL seconds, and the stack
+# of the reactor is logged in server/logs/lag.log when it's blocked for
+# LAG_THRESHOLD seconds
+LAG_INTERVAL = 0.05
+LAG_THRESHOLD = 0.5
+
+# Metrics in the Prometheus text format, served on
+# http://METRICS_INTERFACE:METRICS_PORT/metrics (None to disable)
+METRICS_PORT = 4010
+METRICS_INTERFACE = "127.0.0.1"
+
+# Default duration (in seconds) and rate (samples per second) of the
+# profile command
+PROFILE_DURATION = 30
+PROFILE_RATE = 100
+
+# Branch fetched by the deploy command (None for the upstream of the
+# current branch)
+DEPLOY_REMOTE = "origin"
+DEPLOY_BRANCH = None
+
+# Warm-up at server start: stages loading the working set in bulk
+# (channels, rooms, exits, accounts, characters), accounts being the
+# ones logged in during the last WARMUP_RECENT_DAYS days (at most
+# WARMUP_LIMIT).  Set WARMUP_STAGES to () to disable the warm-up
+WARMUP_STAGES = ("channels", "rooms", "exits", "accounts", "characters")
+WARMUP_RECENT_DAYS = 7
+WARMUP_LIMIT = 500
+
+# In-memory caches kept across reloads (see world.snapshot): the snapshot
+# is dropped if it's older than SNAPSHOT_MAX_AGE seconds
+SNAPSHOT_FILE = os.path.join(GAME_DIR, "server", "snapshot.pickle")
+SNAPSHOT_MAX_AGE = 600
+
+# Database query debugging: when QUERY_DEBUG is set, commands and menu
+# nodes running more than QUERY_BUDGET queries, or the same query shape
+# QUERY_REPEAT_THRESHOLD times, are logged in server/logs/query.log
+QUERY_DEBUG = False
+QUERY_BUDGET = 20
+QUERY_REPEAT_THRESHOLD = 5
+
+# Input scheduling: the input of sessions is run in turn, at most
+# INPUT_TICK_BUDGET inputs at once, and each session can queue up to
+# INPUT_QUEUE_SIZE inputs.  Rate limits are (inputs per second, burst)
+# for the first permission the account has (None for no limit).
+INPUT_TICK_BUDGET = 50
+INPUT_QUEUE_SIZE = 100
+INPUT_RATE_LIMITS = (
+    ("Admin", None),
+    ("Builder", (10, 40)),
+    ("Player", (5, 20)),
+)
+INPUT_RATE_UNLOGGED = (2, 10)
+
+# Attributes changed often, written to the database in batches every
+# WRITE_BEHIND_INTERVAL seconds and when the server stops
+WRITE_BEHIND_ATTRIBUTES = ("afk", "valid", "sent_validation", "validation_code")
+WRITE_BEHIND_INTERVAL = 5
+
 # Search settings
 SEARCH_MULTIMATCH_REGEX = r"(?P<number>[0-9]+)\.(?P<name>.*)"
 SEARCH_MULTIMATCH_TEMPLATE = "  {number}.{name}{aliases}{info}\n"
@@ -86,9 +169,18 @@ DEFAULT_CHANNELS = [
 # Channel options
 CHANNEL_COMMAND_CLASS = "commands.comms.ChannelCommand"
 
+# Channel flood protection: (messages per minute, burst) for each speaker
+# on a channel and for the whole channel.  Admins can change them per
+# channel with the /throttle switch.
+CHANNEL_THROTTLE_SPEAKER = (20, 5)
+CHANNEL_THROTTLE_CHANNEL = (120, 20)
+
 ## Web
+# The mail stack (anymail, requests) is only imported when an email is
+# sent.  Set MAILGUN_INBOUND to True to receive inbound mail: the anymail
+# app and its inbound signal are then loaded when the process starts
+MAILGUN_INBOUND = False
 INSTALLED_APPS += (
-        "anymail",
         "web.mailgun",
 )
 
@@ -99,3 +191,6 @@ try:
     from server.conf.secret_settings import *
 except ImportError:
     pass
+
+if MAILGUN_INBOUND:
+    INSTALLED_APPS += ("anymail", )
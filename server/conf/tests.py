@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the server configuration.
+
+Run them from the game directory:
+
+    evennia test --settings settings.py server
+
+"""
+
+from evennia import CmdSet, Command
+from evennia.server.serversession import ServerSession as BaseServerSession
+from evennia.server.sessionhandler import SESSIONS
+from evennia.utils.test_resources import EvenniaTest
+from mock import patch
+
+from server.conf.cmdparser import cmdparser, get_index
+from server.conf.serversession import ServerSession, get_plain_text
+from world.render import RAW_OPTIONS, RENDER
+
+
+class OutputTest(EvenniaTest):
+
+    """Base class for tests of the output of a session."""
+
+    protocol_key = "websocket"
+
+    def setUp(self):
+        super(OutputTest, self).setUp()
+        self.output = ServerSession()
+        self.output.init_session(self.protocol_key, ("localhost", "testmode"), SESSIONS)
+        patcher = patch("server.conf.serversession.reactor")
+        self.reactor = patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestOutputCoalescing(OutputTest):
+
+    """Text sent to a session during a reactor turn is sent in one frame."""
+
+    def test_plain_text(self):
+        self.assertEqual(get_plain_text({"text": "Bonjour."}), "Bonjour.")
+        self.assertEqual(get_plain_text({"text": "Bonjour.", "options": None}), "Bonjour.")
+        self.assertEqual(get_plain_text({"text": ("Bonjour.", {}), "options": {}}), "Bonjour.")
+        self.assertIsNone(get_plain_text({"text": "", "options": {"echo": False}}))
+        self.assertIsNone(get_plain_text({"text": "Bonjour.", "prompt": ">"}))
+        self.assertIsNone(get_plain_text({"text": ("Bonjour.", {"type": "say"})}))
+
+    @patch.object(BaseServerSession, "data_out")
+    def test_object_msg(self, data_out):
+        self.char1.msg("Premier message.", session=self.output)
+        self.char1.msg("Second message.", session=self.output)
+        self.assertFalse(data_out.called)
+        self.reactor.callLater.assert_called_once_with(0, self.output.flush_output)
+
+        self.output.flush_output()
+        data_out.assert_called_once_with(text=u"Premier message.|n\nSecond message.")
+
+    @patch.object(BaseServerSession, "data_out")
+    def test_options(self, data_out):
+        self.char1.msg("Premier message.", session=self.output)
+        self.char1.msg("", options={"echo": False}, session=self.output)
+        self.assertEqual(data_out.call_count, 2)
+        data_out.assert_any_call(text="Premier message.")
+        data_out.assert_called_with(text="", options={"echo": False})
+
+
+class TestRenderedOutput(OutputTest):
+
+    """Text sent to telnet clients is rendered with the cache."""
+
+    protocol_key = "telnet"
+
+    def setUp(self):
+        super(TestRenderedOutput, self).setUp()
+        RENDER.clear()
+
+    @patch.object(BaseServerSession, "data_out")
+    def test_object_msg(self, data_out):
+        hits = RENDER.hits.value
+        for number in range(3):
+            self.char1.msg("|rAlerte !|n", session=self.output)
+            self.output.flush_output()
+
+        self.assertEqual(RENDER.hits.value - hits, 2)
+        self.assertEqual(data_out.call_count, 3)
+        kwargs = data_out.call_args[1]
+        self.assertNotIn("|r", kwargs["text"])
+        self.assertEqual(kwargs["options"], RAW_OPTIONS)
+
+    @patch.object(BaseServerSession, "data_out")
+    def test_not_buffered(self, data_out):
+        self.char1.msg(("|rAlerte !|n", {"type": "say"}), prompt=">", session=self.output)
+        kwargs = data_out.call_args[1]
+        self.assertNotIn("|r", kwargs["text"][0])
+        self.assertEqual(kwargs["text"][1], {"type": "say"})
+        self.assertEqual(kwargs["options"], RAW_OPTIONS)
+        self.assertEqual(kwargs["prompt"], ">")
+
+    @patch.object(BaseServerSession, "data_out")
+    def test_render_options(self, data_out):
+        self.char1.msg("|rAlerte !|n", options={"raw": True}, session=self.output)
+        data_out.assert_called_once_with(text="|rAlerte !|n", options={"raw": True})
+
+
+class CmdLook(Command):
+    key = "look"
+    aliases = ["l"]
+    arg_regex = r"\s|$"
+
+
+class CmdInventory(Command):
+    key = "inventory"
+    aliases = ["i", "@inv"]
+    arg_regex = r"\s|$"
+
+
+class CmdEmote(Command):
+    key = "emote"
+    aliases = [":"]
+    arg_regex = None
+
+
+class CmdSmile(Command):
+    key = "sourire"
+
+
+class TestCmdParser(EvenniaTest):
+
+    """The command parser matches the input like Evennia's."""
+
+    def setUp(self):
+        super(TestCmdParser, self).setUp()
+        self.cmdset = CmdSet()
+        for cmd in (CmdLook(), CmdInventory(), CmdEmote()):
+            self.cmdset.add(cmd)
+
+    def parse(self, raw_string):
+        """Return the (command key, args) of the matches."""
+        return [(match[2].key, match[1]) for match in
+                cmdparser(raw_string, self.cmdset, self.char1)]
+
+    def test_arg_regex(self):
+        self.assertEqual(self.parse("look"), [("look", "")])
+        self.assertEqual(self.parse("look here"), [("look", " here")])
+        self.assertEqual(self.parse("l here"), [("look", " here")])
+        self.assertEqual(self.parse("lx"), [])
+        self.assertEqual(self.parse("ix"), [])
+        self.assertEqual(self.parse("lookx"), [])
+
+    def test_without_arg_regex(self):
+        self.assertEqual(self.parse(":sourit"), [("emote", "sourit")])
+        self.assertEqual(self.parse("emote sourit"), [("emote", " sourit")])
+
+    def test_prefixes(self):
+        self.assertEqual(self.parse("@inv"), [("inventory", "")])
+        self.assertEqual(self.parse("inv"), [("inventory", "")])
+        self.assertEqual(self.parse("@look"), [("look", "")])
+
+    def test_index_cache(self):
+        index = get_index(self.cmdset)
+        self.assertIs(get_index(self.cmdset), index)
+        self.cmdset.add(CmdSmile())
+        self.assertIsNot(get_index(self.cmdset), index)
+        self.assertEqual(self.parse("sourire"), [("sourire", "")])
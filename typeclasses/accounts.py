@@ -23,8 +23,11 @@ several more options for customizing the Guest account system.
 """
 
 from evennia import DefaultAccount, DefaultGuest
+from evennia.utils.utils import lazy_property
 
-from web.mailgun.models import EmailAddress
+from world.attributes import WriteBehindAttributeHandler, prefetch_attributes
+from world.directory import DIRECTORY
+from world.scheduler import INPUT
 
 
 class Account(DefaultAccount):
@@ -92,8 +95,51 @@ class Account(DefaultAccount):
      at_server_reload()
      at_server_shutdown()
 
+    Attributes listed in `WRITE_BEHIND_ATTRIBUTES` (like the validation
+    flags) are written behind (see `world.attributes`).
+
     """
 
+    @lazy_property
+    def attributes(self):
+        return WriteBehindAttributeHandler(self)
+
+    @classmethod
+    def prefetch_attributes(cls, accounts, keys, category=None):
+        """
+        Load attributes of several accounts in one query.
+
+        See `world.attributes.prefetch_attributes`.
+
+        """
+        return prefetch_attributes(accounts, keys, category)
+
+    def at_post_login(self, session=None, **kwargs):
+        """
+        Called at the end of the login process.
+
+        Add the account to the directory of connected accounts, and
+        read the input rate limit of the session again (it was the
+        limit of unlogged sessions).
+
+        """
+        DIRECTORY.add_account(self)
+        for session in [session] if session else self.sessions.all():
+            INPUT.forget_limit(session)
+        super(Account, self).at_post_login(session=session, **kwargs)
+
+    def at_post_disconnect(self, **kwargs):
+        """
+        Called after a session of this account disconnected.
+
+        Remove the account from the directory of connected accounts,
+        if it has no other session.
+
+        """
+        super(Account, self).at_post_disconnect(**kwargs)
+        if not self.sessions.count():
+            DIRECTORY.remove_account(self)
+
     def record_email_address(self):
         """
         Record the account's adress email in the app used by Mailgun.
@@ -101,6 +147,7 @@ class Account(DefaultAccount):
         This method is automatically called when an account is validated.
 
         """
+        from web.mailgun.models import EmailAddress
         email, _ = EmailAddress.objects.get_or_create(db_email=self.email)
         email.db_display_name = self.key
         email.save()
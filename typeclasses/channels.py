@@ -12,7 +12,14 @@ to be modified.
 
 """
 
+import time
+
 from evennia import DefaultChannel
+from evennia.utils import logger
+
+from world.logfile import format_timestamp, get_log
+from world.metrics import counter
+from world.throttle import CHANNELS
 
 
 class Channel(DefaultChannel):
@@ -58,4 +65,65 @@ class Channel(DefaultChannel):
         post_send_message(msg) - called just after message was sent to channel
 
     """
-    pass
+
+    def at_init(self):
+        """
+        Called when the channel is loaded in memory.
+
+        Restore the rate limits set by the /throttle switch.
+
+        """
+        super(Channel, self).at_init()
+        limits = self.db.throttle
+        if limits:
+            CHANNELS.configure(self.key, limits)
+
+    def get_log(self):
+        """
+        Return the segmented log of this channel.
+
+        The log is named after the 'log_file' attribute, if set, or
+        'channel_{key}' otherwise.  It is rotated and compressed (see
+        `world.logfile`).
+
+        """
+        name = self.attributes.get("log_file") or "channel_%s" % self.key
+        if name.endswith(".log"):
+            name = name[:-4]
+
+        return get_log(name)
+
+    def distribute_message(self, msgobj, online=False, **kwargs):
+        """
+        Send a message to all connected accounts and log it.
+
+        This is the default behavior, except for the log, which is
+        written in a segmented log instead of an unbounded file.
+
+        Args:
+            msgobj (Msg or TempMsg): the message to send.
+            online (bool, optional): only send to accounts currently online.
+
+        """
+        if online:
+            subs = self.subscriptions.online()
+        else:
+            subs = self.subscriptions.all()
+
+        counter("channel_messages", "Messages sent on channels",
+                channel=self.key.lower()).incr()
+        mutelist = self.mutelist
+        for entity in subs:
+            if entity in mutelist:
+                continue
+
+            try:
+                entity.msg(msgobj.message, from_obj=msgobj.senders,
+                        options={"from_channel": self.id})
+            except AttributeError as e:
+                logger.log_trace("%s\nCannot send msg to '%s'." % (e, entity))
+
+        if getattr(msgobj, "keep_log", True):
+            now = time.time()
+            self.get_log().write(u"{} [-] {}".format(format_timestamp(now),
+                    msgobj.message.strip()), now)
@@ -8,13 +8,58 @@ creation commands.
 
 """
 from evennia import DefaultCharacter
+from evennia.utils.utils import lazy_property
+
+from world.attributes import WriteBehindAttributeHandler
+from world.directory import DIRECTORY
+from world.idle import IDLE
+from world.presence import ROSTER
+from world.scheduler import INPUT
 
 
 class Character(DefaultCharacter):
     """
     Character class.
+
+    Attributes listed in `WRITE_BEHIND_ATTRIBUTES` (like 'afk') are
+    written behind (see `world.attributes`).
+
+    Setting the key (or the name) saves it and calls `at_rename`.
+
     """
 
+    @lazy_property
+    def attributes(self):
+        return WriteBehindAttributeHandler(self)
+
+    @property
+    def key(self):
+        return self.db_key
+
+    @key.setter
+    def key(self, value):
+        oldname = self.db_key
+        self.db_key = value
+        self.save(update_fields=["db_key"])
+        self.at_rename(oldname, value)
+
+    def at_rename(self, oldname, newname):
+        """
+        Called after the character has been renamed.
+
+        The roster and the directory of names are updated at once, so
+        that the `who` command keeps reading its table from the cache.
+
+        Args:
+            oldname (str): the previous key.
+            newname (str): the new key.
+
+        """
+        ROSTER.rename(self)
+        if self.account and self.sessions.count():
+            DIRECTORY.remove_name(self.account, oldname)
+            DIRECTORY.add_name(self.account, newname)
+
     def at_post_puppet(self, **kwargs):
         """
         Called just after puppeting has been completed and all
@@ -30,6 +75,12 @@ class Character(DefaultCharacter):
             puppeting this Object.
 
         """
+        ROSTER.add(self)
+        IDLE.touch(self)
+        for session in self.sessions.all():
+            INPUT.forget_limit(session)
+        if self.account:
+            DIRECTORY.add_name(self.account, self.key)
         self.msg("\nVous devenez |c%s|n.\n" % self.name)
         self.msg((self.at_look(self.location), {'type': 'look'}), options=None)
         self.location.msg_contents("{char} vient d'entrer en jeu.", exclude=[self], mapping={"char": self}, from_obj=self)
@@ -49,6 +100,9 @@ class Character(DefaultCharacter):
                 overriding the call (unused by default).
         """
         if not self.sessions.count():
+            ROSTER.remove(self)
+            IDLE.forget(self)
+            DIRECTORY.remove_name(account, self.key)
             # only remove this char from grid if no sessions control it anymore.
             if self.location:
                 def message(obj, from_obj):
@@ -12,6 +12,8 @@ inheritance.
 """
 from evennia import DefaultObject
 
+from world.attributes import prefetch_attributes
+
 
 class Object(DefaultObject):
     """
@@ -160,4 +162,13 @@ class Object(DefaultObject):
                                  object speaks
 
      """
-    pass
+
+    @classmethod
+    def prefetch_attributes(cls, objs, keys, category=None):
+        """
+        Load attributes of several objects in one query.
+
+        See `world.attributes.prefetch_attributes`.
+
+        """
+        return prefetch_attributes(objs, keys, category)
@@ -10,6 +10,8 @@ from collections import defaultdict
 from evennia import DefaultRoom
 from evennia.utils.utils import list_to_string
 
+from world.broadcast import broadcast
+
 
 class Room(DefaultRoom):
     """
@@ -21,6 +23,27 @@ class Room(DefaultRoom):
     See examples/object.py for a list of
     properties and methods available on all Objects.
     """
+    def msg_contents(self, text=None, exclude=None, from_obj=None, mapping=None, **kwargs):
+        """
+        Emits a message to all objects inside this room.
+
+        The message is formatted once per class of viewers (builders
+        and everyone else) rather than once per receiver, see
+        `world.broadcast`.
+
+        Args:
+            text (str or tuple): Message to send. If a tuple, this should be
+                on the valid OOB outmessage form `(message, {kwargs})`.
+            exclude (list, optional): A list of objects not to send to.
+            from_obj (Object, optional): An object designated as the
+                "sender" of the message.
+            mapping (dict, optional): A mapping of formatting keys
+                `{"key":<object>, "key2":<object2>,...}.
+            **kwargs (dict): Keyword arguments passed to `msg`.
+
+        """
+        broadcast(self, text, exclude=exclude, from_obj=from_obj, mapping=mapping, **kwargs)
+
     def return_appearance(self, looker, **kwargs):
         """
         This formats a description. It is the hook a 'look' command
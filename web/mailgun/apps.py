@@ -2,10 +2,13 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MailgunConfig(AppConfig):
     name = 'web.mailgun'
 
     def ready(self):
-        from . import signals
+        # The inbound signal loads anymail: only connect it if inbound mail is received
+        if getattr(settings, "MAILGUN_INBOUND", False):
+            from . import signals
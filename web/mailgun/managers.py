@@ -2,7 +2,6 @@ from __future__ import absolute_import, unicode_literals
 
 from django.db import models
 from django.db.models import Q, Count
-from anymail.inbound import AnymailInboundMessage
 
 
 class EmailManager(models.Manager):
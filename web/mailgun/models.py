@@ -1,14 +1,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 import datetime
-import requests
 import time
 
-from anymail.message import AnymailMessage
-from anymail.utils import parse_single_address
 from django.conf import settings
 from django.db import models
-from django.utils.html import strip_tags
 from django.utils.timezone import make_aware
 from evennia.accounts.models import AccountDB
 from evennia.utils.idmapper.models import SharedMemoryModel
@@ -39,6 +35,7 @@ class EmailAddress(SharedMemoryModel):
         if not API_KEY or not news:
             return
 
+        import requests
         url = "https://api.mailgun.net/v3/lists/{}/members".format(news)
 
         before = time.time()
@@ -127,6 +124,11 @@ class EmailMessage(SharedMemoryModel):
             the message was succesfully sent, None otherwise.
 
         """
+        # The mail stack is only imported when sending
+        from anymail.message import AnymailMessage
+        from anymail.utils import parse_single_address
+        from django.utils.html import strip_tags
+
         if "@" not in from_email:
             # We assume this is an alias
             if from_email not in OUTGOING_ALIASES:
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+Attribute helpers: prefetching and write-behind.
+
+Reading one attribute on many objects (like `puppet.db.afk` for every
+connected character) costs one query per object.  `prefetch_attributes`
+loads the attributes of all the objects in one query and fills the
+attribute cache of each object, so reading them afterward doesn't
+query the database.
+
+Example:
+
+>>> from world.attributes import prefetch_attributes
+>>> prefetch_attributes(puppets, ["afk"])
+>>> [puppet.db.afk for puppet in puppets]  # No query
+
+Writing an attribute costs a pickle and an UPDATE.  For the keys of
+`WRITE_BEHIND_ATTRIBUTES` (often toggled, like 'afk'), typeclasses
+using `WriteBehindAttributeHandler` only change the value in memory,
+and `flush_attributes` writes the changed attributes in one
+transaction.  It is called every `WRITE_BEHIND_INTERVAL` seconds by
+`write_behind` (see `server/conf/server_services_plugins.py`) and when
+the server stops.
+
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from evennia.typeclasses.attributes import AttributeHandler
+from evennia.utils.dbserialize import to_pickle
+
+from world.log import main as log
+
+## Constants
+WRITE_BEHIND_ATTRIBUTES = getattr(settings, "WRITE_BEHIND_ATTRIBUTES", ())
+WRITE_BEHIND_INTERVAL = getattr(settings, "WRITE_BEHIND_INTERVAL", 5)
+
+# Attributes changed in memory, by id
+_dirty = {}
+
+def prefetch_attributes(objs, keys, category=None):
+    """
+    Load attributes of several objects in one query.
+
+    The attribute cache of each object is filled, including for the
+    attributes it doesn't have (so that reading them doesn't query
+    the database either).  The objects should share the same database
+    model (all objects, or all accounts).
+
+    Args:
+        objs (list): the typeclassed objects.
+        keys (list of str): the attribute keys.
+        category (str, optional): the category of the attributes.
+
+    Returns:
+        loaded (int): the number of attributes loaded.
+
+    """
+    objs = [obj for obj in objs if obj.pk]
+    if not objs or not keys:
+        return 0
+
+    model = objs[0].__dbclass__.__name__.lower()
+    through = objs[0].db_attributes.through
+    category = category.strip().lower() if category else None
+    query = {
+        "%s__id__in" % model: [obj.id for obj in objs],
+        "attribute__db_model__iexact": model,
+        "attribute__db_attrtype": None,
+        "attribute__db_key__in": list(keys),
+        "attribute__db_category__iexact": category,
+    }
+
+    found = defaultdict(dict)
+    connections = through.objects.filter(**query).select_related("attribute")
+    for connection in connections:
+        attribute = connection.attribute
+        found[getattr(connection, model + "_id")][attribute.db_key.lower()] = attribute
+
+    for obj in objs:
+        cache = obj.attributes._cache
+        attributes = found.get(obj.id, {})
+        for key in keys:
+            key = key.strip().lower()
+            cache["%s-%s" % (key, category)] = attributes.get(key)
+
+    return sum(len(attributes) for attributes in found.values())
+
+def flush_attributes():
+    """
+    Write the attributes changed in memory, in one transaction.
+
+    Returns:
+        flushed (int): the number of attributes written.
+
+    """
+    if not _dirty:
+        return 0
+
+    attributes = list(_dirty.values())
+    _dirty.clear()
+    try:
+        with transaction.atomic():
+            for attribute in attributes:
+                if attribute.pk:
+                    attribute.save(update_fields=["db_value"])
+    except Exception:
+        # Keep the attributes changed since, to try again later
+        for attribute in attributes:
+            _dirty.setdefault(attribute.id, attribute)
+        raise
+
+    return len(attributes)
+
+def write_behind():
+    """
+    Write the attributes changed in memory, logging errors.
+
+    This is the callback of the write-behind timer: an error (like a
+    locked database) doesn't stop the timer, the attributes are kept
+    and written at the next flush.
+
+    """
+    try:
+        flush_attributes()
+    except Exception:
+        log.exception("Write-behind: {} attributes not written, retrying later".format(
+                len(_dirty)))
+
+
+class WriteBehindAttributeHandler(AttributeHandler):
+
+    """
+    Attribute handler writing some attributes behind.
+
+    Existing attributes whose key is in `WRITE_BEHIND_ATTRIBUTES`
+    (without category) are changed in memory and written later by
+    `flush_attributes`.  Removing them sets them to None instead of
+    deleting them, so that toggling them never creates or deletes
+    rows.  Other attributes (and the first creation) are written
+    through as usual.
+
+    Until they are flushed, these changes are not seen by other
+    processes (like the website), and the attribute monitors are
+    notified when they are written.
+
+    """
+
+    def _getcache(self, key=None, category=None):
+        """Prefer the attributes changed in memory to the ones just read."""
+        attributes = super(WriteBehindAttributeHandler, self)._getcache(key, category)
+        if _dirty:
+            attributes = [_dirty.get(attribute.id, attribute) for attribute in attributes]
+
+        return attributes
+
+    def _write_behind(self, key, category, value):
+        """
+        Change an attribute in memory, if it can be written behind.
+
+        Returns:
+            changed (bool): whether the attribute was changed.
+
+        """
+        if category is not None or not isinstance(key, basestring):
+            return False
+
+        if key.strip().lower() not in WRITE_BEHIND_ATTRIBUTES:
+            return False
+
+        attributes = self._getcache(key, None)
+        if not attributes:
+            return False
+
+        attribute = attributes[0]
+        attribute.db_value = to_pickle(value)
+        _dirty[attribute.id] = attribute
+        return True
+
+    def add(self, key, value, category=None, lockstring="", strattr=False,
+            accessing_obj=None, default_access=True):
+        """Add an attribute, writing it behind if possible."""
+        if not lockstring and not strattr and accessing_obj is None:
+            if self._write_behind(key, category, value):
+                return
+
+        super(WriteBehindAttributeHandler, self).add(key, value, category=category,
+                lockstring=lockstring, strattr=strattr, accessing_obj=accessing_obj,
+                default_access=default_access)
+
+    def remove(self, key, raise_exception=False, category=None,
+            accessing_obj=None, default_access=True):
+        """Remove an attribute, or set it to None if it's written behind."""
+        if accessing_obj is None and self._write_behind(key, category, None):
+            return
+
+        super(WriteBehindAttributeHandler, self).remove(key,
+                raise_exception=raise_exception, category=category,
+                accessing_obj=accessing_obj, default_access=default_access)
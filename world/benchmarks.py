@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the hot paths of the game.
+
+These functions need the game to be set up (Django and Evennia
+loaded), so they should be run from `evennia shell` or the `py`
+command:
+
+>>> from world.benchmarks import bench_cmdsets
+>>> print(bench_cmdsets())
+
+The report gives the average time of each step, in milliseconds.
+
+"""
+
+import time
+
+def timeit(function, number):
+    """Return the average time of a function, in seconds."""
+    begin = time.time()
+    for i in range(number):
+        function()
+
+    return (time.time() - begin) / number
+
+def bench_cmdsets(number=1000):
+    """
+    Measure the cost of the cmdsets built at each login.
+
+    A login creates an `AccountCmdSet` and a `CharacterCmdSet` and
+    merges them.  Creation is measured with the cache of commands
+    emptied before each run (the cost before caching) and with the
+    cache kept.
+
+    Args:
+        number (int, optional): the number of runs.
+
+    Returns:
+        report (str): the average time of each step, per login.
+
+    """
+    from commands import default_cmdsets
+    from commands.default_cmdsets import AccountCmdSet, CharacterCmdSet
+
+    def create():
+        return AccountCmdSet(), CharacterCmdSet()
+
+    def create_uncached():
+        default_cmdsets._built.clear()
+        return create()
+
+    account_set, character_set = create()
+
+    def merge():
+        return character_set + account_set
+
+    lines = ["Cmdsets per login ({} runs):".format(number)]
+    for label, function in (
+            ("creation, uncached", create_uncached),
+            ("creation, cached", create),
+            ("merge", merge)):
+        lines.append("  {:<20} {:>7.3f} ms".format(label, timeit(function, number) * 1000))
+
+    return "\n".join(lines)
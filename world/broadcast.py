@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Room broadcasts rendered once per class of viewers.
+
+By default, `msg_contents` formats the message separately for each
+receiver, calling `get_display_name` on every mapped object.  Yet the
+default `get_display_name` only distinguishes two classes of viewers:
+builders, who see the dbref, and everyone else.  `broadcast` groups
+receivers by class and formats the message once per class, using the
+first receiver of the class to render it.
+
+The class of a viewer is checked again for each message, so that
+changes of permissions or locks are taken into account at once.
+
+"""
+
+from evennia import DefaultObject
+from evennia.utils.utils import is_iter, make_iter
+
+## Constants
+BUILDER_LOCK = "perm(Builder)"
+
+_DEFAULT_DISPLAY_NAME = DefaultObject.get_display_name.__func__
+
+def get_viewer_class(location, viewer):
+    """
+    Return the class of a viewer.
+
+    Args:
+        location (Object): the location checking the lock.
+        viewer (Object): the viewer.
+
+    Returns:
+        builder (bool): whether the viewer sees the dbrefs.
+
+    """
+    return location.locks.check_lockstring(viewer, BUILDER_LOCK)
+
+def has_default_display(obj):
+    """Return whether an object uses the default `get_display_name`."""
+    method = getattr(type(obj), "get_display_name", None)
+    return getattr(method, "__func__", None) is _DEFAULT_DISPLAY_NAME
+
+def broadcast(location, text=None, exclude=None, from_obj=None,
+        mapping=None, **kwargs):
+    """
+    Send a message to the contents of a location.
+
+    This has the same behavior as `msg_contents`, which it should be
+    called by.  If a mapped object overrides `get_display_name`, the
+    message is formatted for each receiver.
+
+    Args:
+        location (Object): the location.
+        text (str or tuple): the message, or a (message, {kwargs}) tuple.
+        exclude (list, optional): the objects not receiving the message.
+        from_obj (Object, optional): the sender.
+        mapping (dict, optional): the substitutions to format the message.
+
+    Kwargs:
+        Other keyword arguments are passed to `msg`.
+
+    """
+    is_outcmd = text and is_iter(text)
+    inmessage = text[0] if is_outcmd else text
+    outkwargs = text[1] if is_outcmd and len(text) > 1 else {}
+
+    contents = location.contents
+    if exclude:
+        exclude = make_iter(exclude)
+        contents = [obj for obj in contents if obj not in exclude]
+
+    # Substitutions not depending on the viewer are done once
+    fixed = {}
+    viewed = {}
+    for key, sub in (mapping or {}).items():
+        if hasattr(sub, "get_display_name"):
+            viewed[key] = sub
+        else:
+            fixed[key] = sub
+
+    grouped = all(has_default_display(sub) for sub in viewed.values())
+    if not mapping:
+        outmessage = inmessage
+    elif not viewed:
+        outmessage = inmessage.format(**fixed)
+
+    rendered = {}
+    for obj in contents:
+        if viewed:
+            viewer_class = get_viewer_class(location, obj) if grouped else obj
+            outmessage = rendered.get(viewer_class)
+            if outmessage is None:
+                substitutions = dict(fixed)
+                for key, sub in viewed.items():
+                    substitutions[key] = sub.get_display_name(obj)
+
+                outmessage = inmessage.format(**substitutions)
+                if grouped:
+                    rendered[viewer_class] = outmessage
+
+        obj.msg(text=(outmessage, outkwargs), from_obj=from_obj, **kwargs)
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+"""
+Deployment of new code, before reloading.
+
+Pulling the code while reloading kept players disconnected while git
+was talking to the network.  A deployment does everything it can
+before the reload, in child processes, so the reactor isn't blocked:
+
+1. Fetch the branch (`DEPLOY_REMOTE` and `DEPLOY_BRANCH`, by default
+   the upstream of the current branch).
+2. Stage the new code in a separate worktree (in a temporary
+   directory): the game directory doesn't change yet, so the running
+   server can't import new modules by accident.
+3. Byte-compile the changed modules of the staging worktree, which
+   checks them.  The bytecode is written aside, with the paths of the
+   game directory (for tracebacks), and kept for the switch.
+4. Reload the server.  When it stops, the game directory is moved to
+   the new code (merged in fast-forward only, see `switch`, called by
+   `at_server_reload_stop`) and the bytecode is put in place, so the
+   restarted server doesn't compile the changed modules again.
+
+If a phase fails, the deployment stops, the game directory isn't
+changed and the server isn't reloaded.  The staging worktree is always
+removed.  The duration of each phase is logged in
+'server/logs/deploy.log'.
+
+The deployment is started by the `deploy` command.
+
+"""
+
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.utils import getProcessOutputAndValue
+
+from world.log import deploy as log
+
+## Constants
+DEPLOY_REMOTE = getattr(settings, "DEPLOY_REMOTE", "origin")
+DEPLOY_BRANCH = getattr(settings, "DEPLOY_BRANCH", None)
+
+# Run in a child process: compile modules of the staging worktree in a
+# bytecode directory, with the paths of the game directory
+COMPILE_SCRIPT = """
+import os, py_compile, sys
+staging, bytecode, game = sys.argv[1:4]
+for name in sys.argv[4:]:
+    cfile = os.path.join(bytecode, name + "c")
+    if not os.path.isdir(os.path.dirname(cfile)):
+        os.makedirs(os.path.dirname(cfile))
+    py_compile.compile(os.path.join(staging, name), cfile,
+            os.path.join(game, name), doraise=True)
+"""
+
+class DeployError(RuntimeError):
+
+    """A phase of the deployment failed."""
+
+    pass
+
+
+class Deployment(object):
+
+    """
+    A deployment of the code in the game directory.
+
+    Only one deployment runs at a time.  Progress is reported to a
+    callback, called with a message (in French, for the command).
+
+    """
+
+    def __init__(self, path=None, remote=DEPLOY_REMOTE, branch=DEPLOY_BRANCH):
+        self.path = path or settings.GAME_DIR
+        self.remote = remote
+        self.branch = branch
+        self.running = False
+        self.timings = []
+        self.pending = None
+
+    @inlineCallbacks
+    def run(self, notify=None, reason=""):
+        """
+        Deploy the new code and reload the server.
+
+        Args:
+            notify (callable, optional): called with progress messages.
+            reason (str, optional): the reason of the reload.
+
+        Returns:
+            deferred (Deferred): fired with True if the server reloads,
+                    False if there was no new code, failing with
+                    `DeployError` if a phase failed.
+
+        """
+        if self.running:
+            raise DeployError("Un déploiement est déjà en cours.")
+
+        notify = notify or (lambda message: None)
+        self.running = True
+        self.timings = []
+        self.discard()
+        started = time.time()
+        try:
+            # Fetch
+            with self.phase("fetch"):
+                args = ["fetch", self.remote]
+                if self.branch:
+                    args.append(self.branch)
+                yield self.git(*args)
+
+            target = "{}/{}".format(self.remote, self.branch) if self.branch else "@{u}"
+            old = (yield self.git("rev-parse", "HEAD")).strip()
+            new = (yield self.git("rev-parse", target)).strip()
+            if old == new:
+                log.info("Deploy: already up to date ({})".format(old[:10]))
+                notify("Le code est déjà à jour, le serveur ne redémarre pas.")
+                returnValue(False)
+
+            # Only a fast-forward can be switched to when reloading
+            try:
+                yield self.git("merge-base", "--is-ancestor", old, new)
+            except DeployError:
+                raise DeployError("{} n'est pas en avance rapide sur {}.".format(
+                        new[:10], old[:10]))
+
+            changed = (yield self.git("diff", "--name-only", old, new)).split()
+            notify("Mise à jour de {} à {} ({} fichiers modifiés).".format(
+                    old[:10], new[:10], len(changed)))
+
+            # Stage the new code and compile the changed modules aside
+            directory = tempfile.mkdtemp(prefix="deploy-")
+            staging = os.path.join(directory, "game")
+            bytecode = os.path.join(directory, "bytecode")
+            modules = []
+            try:
+                try:
+                    with self.phase("stage"):
+                        yield self.git("worktree", "add", "--detach", staging, new)
+
+                    modules = [name for name in changed if name.endswith(".py") and
+                            os.path.exists(os.path.join(staging, name))]
+                    if modules:
+                        with self.phase("compile"):
+                            yield self.run_process(sys.executable, ["-c", COMPILE_SCRIPT,
+                                    staging, bytecode, self.path] + modules, name="py_compile")
+                finally:
+                    yield self.remove_staging(staging)
+            except Exception:
+                shutil.rmtree(directory, ignore_errors=True)
+                raise
+
+            self.pending = (new, directory, modules)
+            log.info("Deploy: {} to {} in {:.3f}s ({})".format(old[:10], new[:10],
+                    time.time() - started, ", ".join("{} {:.3f}s".format(name, duration)
+                    for name, duration in self.timings)))
+        finally:
+            self.running = False
+
+        notify("Code prêt en {:.1f} secondes, redémarrage du serveur.".format(
+                time.time() - started))
+        self.reload(reason)
+        returnValue(True)
+
+    def switch(self):
+        """
+        Move the game directory to the staged code, when the server stops.
+
+        This is called by `at_server_reload_stop`, after the last input
+        was handled: it's a local fast-forward, so it only blocks
+        shortly.  If it fails (the game directory was changed since),
+        the error is logged and the server restarts with the old code.
+        The bytecode compiled during the deployment is then installed
+        (see `install_bytecode`).
+
+        Returns:
+            switched (bool): whether the game directory was moved.
+
+        """
+        pending, self.pending = self.pending, None
+        if pending is None:
+            return False
+
+        new, directory, modules = pending
+        started = time.time()
+        try:
+            subprocess.check_output(["git", "merge", "--ff-only", new],
+                    cwd=self.path, stderr=subprocess.STDOUT)
+        except (OSError, subprocess.CalledProcessError) as error:
+            output = getattr(error, "output", None) or error
+            log.error("Deploy: can't switch to {}: {}".format(new[:10], str(output).strip()))
+            shutil.rmtree(directory, ignore_errors=True)
+            return False
+
+        installed = self.install_bytecode(os.path.join(directory, "bytecode"), modules)
+        shutil.rmtree(directory, ignore_errors=True)
+        log.info("Deploy: switched to {} in {:.3f}s ({}/{} modules compiled)".format(
+                new[:10], time.time() - started, installed, len(modules)))
+        return True
+
+    def discard(self):
+        """Forget the code staged but not switched to, if any."""
+        if self.pending is not None:
+            shutil.rmtree(self.pending[1], ignore_errors=True)
+            self.pending = None
+
+    def install_bytecode(self, bytecode, modules):
+        """
+        Put the compiled modules in the game directory.
+
+        The header of a '.pyc' file holds the modification time of its
+        source: git gave the switched files a new one, so it's replaced
+        (the source is the same as the one compiled).  A module that
+        can't be installed is compiled by Python when imported, as usual.
+
+        Args:
+            bytecode (str): the directory of the compiled modules.
+            modules (list of str): the paths of the modules, relative
+                    to the game directory.
+
+        Returns:
+            installed (int): the number of modules installed.
+
+        """
+        installed = 0
+        for name in modules:
+            source = os.path.join(self.path, name)
+            try:
+                with open(os.path.join(bytecode, name + "c"), "rb") as file:
+                    data = file.read()
+
+                mtime = struct.pack("<I", int(os.stat(source).st_mtime) & 0xFFFFFFFF)
+                with open(source + "c", "wb") as file:
+                    file.write(data[:4] + mtime + data[8:])
+            except (IOError, OSError) as error:
+                log.warning("Deploy: can't install the bytecode of {}: {}".format(name, error))
+            else:
+                installed += 1
+
+        return installed
+
+    @inlineCallbacks
+    def remove_staging(self, staging):
+        """Remove a staging worktree."""
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            yield self.git("worktree", "prune")
+        except DeployError:
+            pass
+
+    def reload(self, reason=""):
+        """Reload the server, as the reload command does."""
+        from evennia.server.sessionhandler import SESSIONS
+        reason = "(Reason: %s) " % reason.rstrip(".") if reason else ""
+        SESSIONS.announce_all(" Server restart initiated %s..." % reason)
+        SESSIONS.portal_restart_server()
+
+    def phase(self, name):
+        """Return a context manager timing a phase."""
+        return _Phase(self, name)
+
+    def git(self, *args):
+        """Run git in the game directory."""
+        return self.run_process("git", list(args))
+
+    @inlineCallbacks
+    def run_process(self, executable, args, path=None, name=None):
+        """
+        Run a process, in the game directory by default.
+
+        Args:
+            executable (str): the program to run.
+            args (list of str): its arguments.
+            path (str, optional): the directory to run it in.
+            name (str, optional): the name of the process in messages,
+                    the command line if not set.
+
+        Returns:
+            deferred (Deferred): fired with the output of the process,
+                    failing with `DeployError` if its exit code isn't 0.
+
+        """
+        out, err, code = yield getProcessOutputAndValue(executable, args,
+                env=os.environ, path=path or self.path)
+        if code != 0:
+            command = name or " ".join([os.path.basename(executable)] + args)
+            log.warning("Deploy: {!r} failed ({}): {}".format(command, code, err.strip()))
+            raise DeployError("{} a échoué : {}".format(command, (err or out).strip()))
+
+        returnValue(out)
+
+
+class _Phase(object):
+
+    """Time a phase of a deployment."""
+
+    def __init__(self, deployment, name):
+        self.deployment = deployment
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.time()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.time() - self.started
+        self.deployment.timings.append((self.name, duration))
+        if exc_type is not None:
+            log.warning("Deploy: {} failed after {:.3f}s".format(self.name, duration))
+
+
+DEPLOYMENT = Deployment()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+"""
+Directory of the connected accounts and characters.
+
+Names are indexed in a trie, lowercased and without accents, so that
+'kre' finds 'Kredh' and 'eloise' finds 'Éloïse'.  The directory is
+updated when accounts log in and out and when characters are puppeted
+and unpuppeted, so looking up a name never hits the database.
+
+Example:
+
+>>> from world.directory import DIRECTORY
+>>> DIRECTORY.search("kre")
+[<Account Kredh>]
+>>> DIRECTORY.complete("k")
+[u'Kredh', u'Kalia']
+
+"""
+
+import unicodedata
+
+def normalize(name):
+    """
+    Return a name lowercased and without accents.
+
+    Args:
+        name (str): the name to normalize.
+
+    Returns:
+        normalized (unicode): the normalized name.
+
+    """
+    if isinstance(name, str):
+        name = name.decode("utf-8")
+
+    name = unicodedata.normalize("NFKD", name)
+    return u"".join(char for char in name if not unicodedata.combining(char)).lower()
+
+
+class TrieNode(object):
+
+    """A node of the trie, with the entries ending here."""
+
+    __slots__ = ("children", "entries", "count")
+
+    def __init__(self):
+        self.children = {}
+        self.entries = {}
+        self.count = 0
+
+
+class Trie(object):
+
+    """
+    A trie of normalized names.
+
+    Each name is associated with one or more values (a name can be
+    shared by several accounts, like a character named after another
+    account).  Each node counts the entries below it, so that empty
+    branches can be pruned when names are removed.
+
+    """
+
+    def __init__(self):
+        self.root = TrieNode()
+
+    def __len__(self):
+        return self.root.count
+
+    def add(self, name, value):
+        """Add a name associated with a value."""
+        path = self._path(normalize(name), create=True)
+        node = path[-1]
+        entries = node.entries.setdefault(value, set())
+        if name in entries:
+            return
+
+        entries.add(name)
+        for node in path:
+            node.count += 1
+
+    def remove(self, name, value):
+        """Remove a name associated with a value, if present."""
+        path = self._path(normalize(name))
+        if path is None:
+            return
+
+        node = path[-1]
+        entries = node.entries.get(value)
+        if not entries or name not in entries:
+            return
+
+        entries.discard(name)
+        if not entries:
+            del node.entries[value]
+
+        for node in path:
+            node.count -= 1
+
+        # Prune the empty branches
+        normalized = normalize(name)
+        for i in range(len(normalized), 0, -1):
+            if path[i].count:
+                break
+
+            del path[i - 1].children[normalized[i - 1]]
+
+    def get(self, name):
+        """Return the values of this exact name."""
+        path = self._path(normalize(name))
+        return list(path[-1].entries) if path else []
+
+    def walk(self, prefix, limit=None):
+        """
+        Return the entries beginning with a prefix.
+
+        Args:
+            prefix (str): the prefix.
+            limit (int, optional): the maximum number of entries to return.
+
+        Returns:
+            entries (list): the (name, value) tuples.
+
+        """
+        path = self._path(normalize(prefix))
+        if path is None:
+            return []
+
+        entries = []
+        nodes = [path[-1]]
+        while nodes and (limit is None or len(entries) < limit):
+            node = nodes.pop()
+            for value, names in node.entries.items():
+                entries.extend((name, value) for name in names)
+
+            nodes.extend(child for key, child in sorted(node.children.items(), reverse=True))
+
+        return entries[:limit]
+
+    def _path(self, normalized, create=False):
+        """Return the nodes from the root to a normalized name, or None."""
+        node = self.root
+        path = [node]
+        for char in normalized:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return None
+
+                child = node.children[char] = TrieNode()
+
+            node = child
+            path.append(node)
+
+        return path
+
+
+class Directory(object):
+
+    """
+    The directory of connected accounts, by account and character names.
+
+    The directory is built from the sessions on first use (after a
+    reload, accounts don't log in again), then updated incrementally.
+
+    """
+
+    def __init__(self):
+        self.trie = Trie()
+        self.names = {}
+        self.built = False
+
+    def build(self):
+        """Build the directory from the sessions, if not done yet."""
+        if self.built:
+            return
+
+        from evennia.server.sessionhandler import SESSIONS
+        self.built = True
+        for session in SESSIONS.get_sessions():
+            if session.logged_in and session.account:
+                self.add_account(session.account)
+                if session.puppet:
+                    self.add_name(session.account, session.puppet.key)
+
+    def add_account(self, account):
+        """Add a connected account, by its username."""
+        self.add_name(account, account.username)
+
+    def remove_account(self, account):
+        """Remove an account with all its names."""
+        for name in self.names.pop(account, set()):
+            self.trie.remove(name, account)
+
+    def add_name(self, account, name):
+        """Add a name (like a character name) leading to an account."""
+        self.trie.add(name, account)
+        self.names.setdefault(account, set()).add(name)
+
+    def remove_name(self, account, name):
+        """Remove a name leading to an account."""
+        if name == account.username:
+            return
+
+        self.trie.remove(name, account)
+        names = self.names.get(account)
+        if names:
+            names.discard(name)
+
+    def search(self, name):
+        """
+        Return the accounts matching a name.
+
+        An exact name (ignoring case and accents) has priority.
+        Otherwise, all accounts whose names begin with this prefix are
+        returned: the name is resolved if there is only one.
+
+        Args:
+            name (str): the name or prefix to search.
+
+        Returns:
+            accounts (list of Account): the matching accounts.
+
+        """
+        self.build()
+        if not name:
+            return []
+
+        accounts = self.trie.get(name)
+        if accounts:
+            return accounts
+
+        accounts = []
+        for _, account in self.trie.walk(name):
+            if account not in accounts:
+                accounts.append(account)
+
+        return accounts
+
+    def complete(self, prefix, limit=10):
+        """
+        Return the names beginning with a prefix, for completion.
+
+        Args:
+            prefix (str): the beginning of the name.
+            limit (int, optional): the maximum number of names.
+
+        Returns:
+            names (list of str): the names, sorted.
+
+        """
+        self.build()
+        names = set(name for name, _ in self.trie.walk(prefix, limit))
+        return sorted(names)
+
+
+DIRECTORY = Directory()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+Export of the metrics in the Prometheus text format.
+
+The counters, gauges and histograms of `world.metrics` are updated on
+the hot paths; they are only read when the metrics are scraped.  Other
+numbers (sessions, buffered output, idmapper cache, memory, database
+queries) are collected at that time.
+
+The metrics are served on `METRICS_INTERFACE:METRICS_PORT` (localhost
+by default) by a service started in
+`server/conf/server_services_plugins.py`:
+
+    curl http://localhost:4010/metrics
+
+Histograms are exported as summaries (50th, 90th and 99th percentiles,
+sum and count): the rate of commands is the rate of
+'avenew_command_wall_seconds_count'.
+
+"""
+
+import resource
+
+from django.conf import settings
+from twisted.application.internet import TCPServer
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from world.metrics import counters, gauges, histograms
+from world.querywatch import reports
+
+## Constants
+METRICS_PORT = getattr(settings, "METRICS_PORT", 4010)
+METRICS_INTERFACE = getattr(settings, "METRICS_INTERFACE", "127.0.0.1")
+METRICS_PREFIX = "avenew_"
+QUANTILES = (50, 90, 99)
+
+def format_labels(labels):
+    """Return labels in the Prometheus format, like '{command="look"}'."""
+    if not labels:
+        return ""
+
+    labels = ",".join(u'{}="{}"'.format(name, unicode(value).replace("\\", "\\\\").replace(
+            '"', '\\"').replace("\n", "\\n")) for name, value in sorted(labels.items()))
+    return u"{" + labels + u"}"
+
+def get_rss():
+    """Return the resident memory of the process, in bytes."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except (IOError, IndexError, ValueError):
+        # Not Linux, use the peak instead
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def collect():
+    """
+    Return the current metrics.
+
+    Returns:
+        text (str): the metrics in the Prometheus text format.
+
+    """
+    from evennia.server.sessionhandler import SESSIONS
+    from evennia.utils.idmapper.models import cache_size
+
+    text = MetricsText()
+    sort_key = lambda metric: (metric.name, sorted(metric.labels.items()))
+    for metric in sorted(counters.values(), key=sort_key):
+        text.sample(metric.name + "_total", "counter", metric.description,
+                metric.labels, metric.value)
+
+    for metric in sorted(gauges.values(), key=sort_key):
+        text.sample(metric.name, "gauge", metric.description, metric.labels,
+                metric.value)
+
+    for metric in sorted(histograms.values(), key=sort_key):
+        text.summary(metric)
+
+    # Numbers read when scraping
+    sessions = SESSIONS.values()
+    logged = sum(1 for session in sessions if session.logged_in)
+    text.sample("sessions", "gauge", "Connected sessions", {"state": "logged"}, logged)
+    text.sample("sessions", "gauge", "Connected sessions",
+            {"state": "unlogged"}, len(sessions) - logged)
+    outbox = sum(len(getattr(session, "_output", None) or ()) for session in sessions)
+    text.sample("outbox_depth", "gauge", "Messages buffered in sessions", {}, outbox)
+
+    total, classes = cache_size()
+    text.sample("idmapper_cache_objects", "gauge", "Objects in the idmapper cache",
+            {}, total)
+    for name, number in sorted(classes.items()):
+        text.sample("idmapper_cache_class_objects", "gauge",
+                "Objects in the idmapper cache by class", {"class": name}, number)
+
+    for label, report in sorted(reports.items()):
+        text.sample("db_queries_total", "counter",
+                "Database queries (if QUERY_DEBUG is set)", {"label": label},
+                report.queries)
+        text.sample("db_query_seconds_total", "counter",
+                "Time spent in database queries (if QUERY_DEBUG is set)",
+                {"label": label}, report.time)
+
+    text.sample("process_resident_memory_bytes", "gauge", "Resident memory",
+            {}, get_rss())
+    return text.render()
+
+
+class MetricsText(object):
+
+    """
+    Metrics being written in the Prometheus text format.
+
+    Samples of the same name should be written one after the other:
+    their type and description are written before the first one.
+
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self.lines = []
+        self.seen = set()
+
+    def render(self):
+        """Return the text, encoded in UTF-8."""
+        return (u"\n".join(self.lines) + u"\n").encode("utf-8")
+
+    def describe(self, name, kind, description):
+        """Write the type and description of a metric, the first time."""
+        if name not in self.seen:
+            self.seen.add(name)
+            self.lines.append(u"# HELP {} {}".format(name, description))
+            self.lines.append(u"# TYPE {} {}".format(name, kind))
+
+    def sample(self, name, kind, description, labels, value):
+        """Write a sample."""
+        name = self.prefix + name
+        self.describe(name, kind, description)
+        self.lines.append(u"{}{} {}".format(name, format_labels(labels), value))
+
+    def summary(self, histogram):
+        """Write a histogram as a summary."""
+        name = self.prefix + histogram.name
+        self.describe(name, "summary", histogram.description)
+        for quantile in QUANTILES:
+            labels = dict(histogram.labels, quantile=quantile / 100.0)
+            self.lines.append(u"{}{} {}".format(name, format_labels(labels),
+                    histogram.percentile(quantile)))
+
+        labels = format_labels(histogram.labels)
+        self.lines.append(u"{}_sum{} {}".format(name, labels, histogram.total))
+        self.lines.append(u"{}_count{} {}".format(name, labels, histogram.count))
+
+
+class MetricsResource(Resource):
+
+    """The web resource serving the metrics."""
+
+    isLeaf = True
+
+    def render_GET(self, request):
+        request.setHeader("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        return collect()
+
+
+def get_service(port=METRICS_PORT, interface=METRICS_INTERFACE):
+    """Return the service serving the metrics."""
+    return TCPServer(port, Site(MetricsResource()), interface=interface)
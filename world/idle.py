@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+"""
+Idle tracking and automatic AFK.
+
+Rather than having one timer per character, a single hashed timer
+wheel keeps the deadline of every puppeted character.  The wheel is a
+list of slots, each covering `resolution` seconds, and a character is
+placed in the slot of its deadline.  Receiving input only updates the
+deadline (the character stays in its slot): when the slot is reached,
+characters whose deadline has moved are placed in a later slot, and
+the others are set AFK in one batch.
+
+The wheel is advanced by a single `TimerService` (see
+`server/conf/server_services_plugins.py`), and idle times are updated
+by the `text` input function (see `server/conf/inputfuncs.py`).
+
+"""
+
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from world.log import main as log
+from world.presence import ROSTER
+from world.snapshot import register
+
+## Constants
+AUTO_AFK_DELAY = getattr(settings, "AUTO_AFK_DELAY", 15 * 60)
+AUTO_AFK_MESSAGE = "inactif"
+
+class TimerWheel(object):
+
+    """
+    A hashed timer wheel.
+
+    Keys are placed in the slot of their deadline.  Deadlines beyond
+    the span of the wheel are placed in the last slot and moved again
+    when this slot is reached.  Scheduling and moving a deadline later
+    are O(1), expired keys are returned in batches by `advance`.
+
+    """
+
+    def __init__(self, resolution=5, size=64, now=None):
+        self.resolution = resolution
+        self.size = size
+        self.slots = [set() for i in range(size)]
+        self.deadlines = {}
+        self.placed = {}
+        self.position = 0
+        self.time = time.time() if now is None else now
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def schedule(self, key, deadline):
+        """
+        Schedule a key, or change its deadline.
+
+        A key already in the wheel isn't moved if its deadline comes
+        later, it will be moved when its current slot is reached.
+
+        Args:
+            key (hashable): the key to schedule.
+            deadline (float): the time at which the key expires.
+
+        """
+        previous = self.deadlines.get(key)
+        self.deadlines[key] = deadline
+        if previous is None or deadline < previous:
+            if previous is not None:
+                self.slots[self.placed[key]].discard(key)
+
+            self._place(key, deadline)
+
+    def cancel(self, key):
+        """Remove a key from the wheel."""
+        if self.deadlines.pop(key, None) is not None:
+            self.slots[self.placed.pop(key)].discard(key)
+
+    def advance(self, now=None):
+        """
+        Advance the wheel to the current time.
+
+        Args:
+            now (float, optional): the current time.
+
+        Returns:
+            expired (list): the keys whose deadline has passed.
+
+        """
+        now = time.time() if now is None else now
+        expired = []
+        while self.time + self.resolution <= now:
+            self.time += self.resolution
+            self.position = (self.position + 1) % self.size
+            slot = self.slots[self.position]
+            keys = list(slot)
+            slot.clear()
+            for key in keys:
+                deadline = self.deadlines[key]
+                if deadline <= self.time:
+                    del self.deadlines[key]
+                    del self.placed[key]
+                    expired.append(key)
+                else:
+                    self._place(key, deadline)
+
+        return expired
+
+    def _place(self, key, deadline):
+        """Place a key in the slot of its deadline."""
+        ticks = int((deadline - self.time) // self.resolution) + 1
+        ticks = min(max(ticks, 1), self.size - 1)
+        position = (self.position + ticks) % self.size
+        self.slots[position].add(key)
+        self.placed[key] = position
+
+
+class IdleTracker(object):
+
+    """
+    Track the last input of puppeted characters and set them AFK.
+
+    Characters set AFK by the tracker come back when they send input.
+    Characters set AFK by the `afk` command are left alone.
+
+    """
+
+    def __init__(self, delay=AUTO_AFK_DELAY, resolution=5):
+        self.delay = delay
+        self.resolution = resolution
+        self.wheel = TimerWheel(resolution, max(2, int(delay // resolution) + 2))
+        self.puppets = {}
+        self.last_input = {}
+        self.auto = set()
+        self.built = False
+
+    def build(self):
+        """Track the characters already puppeted (after a reload)."""
+        from evennia.server.sessionhandler import SESSIONS
+        self.built = True
+        for session in SESSIONS.get_sessions():
+            if session.puppet and session.puppet.id not in self.puppets:
+                self.touch(session.puppet, session.cmd_last_visible, back=False)
+
+    def touch(self, puppet, now=None, back=True):
+        """
+        Record input from a character.
+
+        Args:
+            puppet (Character): the character sending input.
+            now (float, optional): the time of the input.
+            back (bool, optional): bring the character back if it was
+                    set AFK by the tracker.
+
+        """
+        if not self.delay:
+            return
+
+        now = time.time() if now is None else now
+        self.puppets[puppet.id] = puppet
+        self.last_input[puppet.id] = now
+        self.wheel.schedule(puppet.id, now + self.delay)
+        if back and puppet.id in self.auto:
+            self.auto.discard(puppet.id)
+            if puppet.db.afk == AUTO_AFK_MESSAGE:
+                del puppet.db.afk
+                ROSTER.set_afk(puppet, None)
+                puppet.msg("|gVous n'êtes plus AFK.|n")
+
+    def forget(self, puppet):
+        """Stop tracking a character."""
+        self.wheel.cancel(puppet.id)
+        self.puppets.pop(puppet.id, None)
+        self.last_input.pop(puppet.id, None)
+        self.auto.discard(puppet.id)
+
+    def get_idle(self, puppet, now=None):
+        """Return the number of seconds since the last input, or None."""
+        last = self.last_input.get(puppet.id)
+        if last is None:
+            return None
+
+        now = time.time() if now is None else now
+        return now - last
+
+    def tick(self, now=None):
+        """
+        Advance the wheel and set the idle characters AFK.
+
+        This is called regularly by a `TimerService`.  Expired
+        characters are set AFK in one transaction.  An error on a
+        character is logged and doesn't prevent the others from being
+        set AFK (nor stop the timer).
+
+        """
+        if not self.delay:
+            return
+
+        if not self.built:
+            try:
+                self.build()
+            except Exception:
+                log.exception("Auto-AFK: can't track the puppeted characters")
+
+        expired = self.wheel.advance(now)
+        puppets = [self.puppets[id] for id in expired if id in self.puppets]
+        if not puppets:
+            return
+
+        with transaction.atomic():
+            for puppet in puppets:
+                try:
+                    with transaction.atomic():
+                        self.set_afk(puppet)
+                except Exception:
+                    log.exception("Auto-AFK: can't set #{} AFK".format(puppet.id))
+
+    def set_afk(self, puppet):
+        """Set an idle character AFK, unless it already is."""
+        if ROSTER.get_afk(puppet):
+            return
+
+        puppet.db.afk = AUTO_AFK_MESSAGE
+        self.auto.add(puppet.id)
+        ROSTER.set_afk(puppet, AUTO_AFK_MESSAGE)
+        puppet.msg("|gVous passez AFK (inactif).|n")
+
+IDLE = IdleTracker()
+
+# Characters set AFK by the tracker should still come back after a reload
+register("idle", lambda: sorted(IDLE.auto), IDLE.auto.update)
@@ -13,13 +13,298 @@ Example:
 >>> # gps here is a singleton logger
 >>> gps.info("...")
 
+Loggers don't write to their files directly: records are put in a
+queue and written by a single writer thread (see `LogWriter`), so that
+logging only costs an enqueue on the reactor thread.  The writer
+writes records in batches and flushes the files every
+`LOG_FLUSH_INTERVAL` seconds.  If the queue is full (the disk stalls),
+records are dropped and counted rather than blocking the game.
+
+If `LOG_FORMAT` is set to "json" in the settings, files are written
+in JSON lines, with the fields of `LOG_FIELDS` given as extra:
+
+>>> log.warning("Slow command", extra={"account": account, "duration": 0.6})
+
+Such logs can be searched with `world.logquery` (or the `logs` command).
+
+Loggers write records of `LOG_LEVEL` and above (or the level given in
+`LOG_LEVELS` for a logger).  Levels can be changed while the game runs
+with `set_level` (or the `logs/level` command).  Call sites logging
+often can keep one record in N, or at most N records per second:
+
+>>> log.debug("Moving %s", obj, extra={"sample": 100})
+>>> log.debug("Sending %r", text, extra={"rate": 5})
+
+Debug records are limited to `LOG_DEBUG_RATE` per second and call site
+anyway (see `CallSiteFilter`), so that debug data stays available
+without flooding the disk.
+
 """
 
 from datetime import datetime
+import json
 import logging
+import Queue
+import threading
+import time
+
+from django.conf import settings
+
+from world.logfile import SegmentHandler
+from world.metrics import counter
+from world.throttle import TokenBuckets
+
+## Constants
+LOG_FORMAT = getattr(settings, "LOG_FORMAT", "text")
+LOG_FIELDS = ("account", "character", "session", "command", "duration")
+LOG_LEVEL = getattr(settings, "LOG_LEVEL", "DEBUG")
+LOG_LEVELS = getattr(settings, "LOG_LEVELS", {})
+LOG_DEBUG_RATE = getattr(settings, "LOG_DEBUG_RATE", (10, 50))
+LOG_CALL_SITES = 1024
+LOG_QUEUE_SIZE = 10000
+LOG_FLUSH_INTERVAL = 1.0
+LOG_BATCH_SIZE = 500
 
 loggers = {}
 
+class LogWriter(object):
+
+    """
+    A writer thread handling the records of all the loggers.
+
+    Records are put in a bounded queue with the handlers that should
+    write them.  The thread takes them in batches and flushes the
+    handlers regularly.  It is started on the first record.
+
+    """
+
+    def __init__(self, size=LOG_QUEUE_SIZE, interval=LOG_FLUSH_INTERVAL):
+        self.queue = Queue.Queue(size)
+        self.interval = interval
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dirty = set()
+        self.dropped = counter("log_dropped", "Log records dropped because the queue was full")
+
+    def put(self, handlers, record):
+        """
+        Queue a record, dropping it if the queue is full.
+
+        Args:
+            handlers (list of Handler): the handlers to write the record.
+            record (LogRecord): the record, already prepared.
+
+        """
+        self.start()
+        try:
+            self.queue.put_nowait((handlers, record))
+        except Queue.Full:
+            self.dropped.incr()
+
+    def flush(self, timeout=5):
+        """
+        Wait until the queued records are written and flushed.
+
+        Args:
+            timeout (float, optional): the maximum time to wait.
+
+        """
+        if self.thread is None or not self.thread.is_alive():
+            return
+
+        done = threading.Event()
+        try:
+            self.queue.put((None, done), timeout=timeout)
+        except Queue.Full:
+            return
+
+        done.wait(timeout)
+
+    def start(self):
+        """Start the writer thread, if not running."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="log-writer")
+                self.thread.daemon = True
+                self.thread.start()
+
+    def run(self):
+        """Write the queued records, in the writer thread."""
+        flushed = time.time()
+        while True:
+            timeout = max(flushed + self.interval - time.time(), 0.01)
+            try:
+                batch = [self.queue.get(timeout=timeout)]
+            except Queue.Empty:
+                batch = []
+
+            while batch and len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            events = []
+            for handlers, record in batch:
+                if handlers is None:
+                    events.append(record)
+                else:
+                    self.write(handlers, record)
+
+            if events or time.time() - flushed >= self.interval:
+                self.flush_handlers()
+                flushed = time.time()
+
+            for event in events:
+                event.set()
+
+    def write(self, handlers, record):
+        """Write a record with its handlers."""
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                try:
+                    handler.handle(record)
+                except Exception:
+                    handler.handleError(record)
+                self.dirty.add(handler)
+
+    def flush_handlers(self):
+        """Flush the handlers written since the last flush."""
+        dirty = self.dirty
+        self.dirty = set()
+        for handler in dirty:
+            try:
+                handler.flush()
+            except Exception:
+                pass
+
+
+class QueueHandler(logging.Handler):
+
+    """
+    A handler putting records in the queue of the writer thread.
+
+    The message of the record is formatted before being queued, since
+    its arguments could change (or not be usable) in another thread.
+
+    """
+
+    def __init__(self, handlers, writer):
+        logging.Handler.__init__(self)
+        self.handlers = handlers
+        self.writer = writer
+
+    def emit(self, record):
+        try:
+            self.writer.put(self.handlers, self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def prepare(self, record):
+        """Merge the arguments and the traceback in the record."""
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        # Extra fields (like an account) are converted to text here
+        for field in LOG_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None and not isinstance(value, (basestring, int, long, float)):
+                setattr(record, field, unicode(value))
+
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+
+    """
+    A formatter writing records as JSON lines.
+
+    The 'time' field comes first, so that lines can be searched by
+    time like text lines (see `world.logfile.parse_timestamp`).
+
+    """
+
+    def format(self, record):
+        moment = datetime.fromtimestamp(record.created)
+        data = {
+            "logger": record.name.split(".", 1)[-1],
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for field in LOG_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+
+        if record.exc_text:
+            data["traceback"] = record.exc_text
+
+        line = json.dumps(data, sort_keys=True)
+        return u'{{"time": "{}.{:03d}", {}'.format(moment.strftime("%Y-%m-%d %H:%M:%S"),
+                int(record.msecs), line[1:])
+
+
+class CallSiteFilter(logging.Filter):
+
+    """
+    A filter sampling and rate-limiting records by call site.
+
+    The call site is the file and line of the logging call.  Records
+    can give as extra:
+        sample (int): keep one record in `sample` from this call site.
+        rate (float): keep at most `rate` records per second (with a
+                burst of as many) from this call site.
+
+    Debug records without a rate are limited to `LOG_DEBUG_RATE`
+    (records per second, burst).  Other records are always kept,
+    unless they ask to be sampled or limited.
+
+    """
+
+    def __init__(self, debug_rate=LOG_DEBUG_RATE, size=LOG_CALL_SITES):
+        logging.Filter.__init__(self)
+        self.size = size
+        self.seen = {}
+        self.buckets = TokenBuckets(size, debug_rate[0], debug_rate[1])
+        self.sampled = counter("log_sampled", "Log records skipped by sampling")
+        self.limited = counter("log_rate_limited", "Log records skipped by rate limits")
+
+    def filter(self, record):
+        sample = getattr(record, "sample", None)
+        rate = getattr(record, "rate", None)
+        debug = record.levelno <= logging.DEBUG
+        if not debug and sample is None and rate is None:
+            return True
+
+        site = (record.pathname, record.lineno)
+        if sample and sample > 1:
+            if site not in self.seen and len(self.seen) >= self.size:
+                self.seen.clear()
+
+            seen = self.seen.get(site, 0)
+            self.seen[site] = seen + 1
+            if seen % sample:
+                self.sampled.incr()
+                return False
+
+        if rate is not None or debug:
+            if not self.buckets.allow(site, 1, rate, rate):
+                self.limited.incr()
+                return False
+
+        return True
+
+
+WRITER = LogWriter()
+FILTER = CallSiteFilter()
+
 def logger(name):
     """
     Return an existing or new logger.
@@ -33,43 +318,87 @@ def logger(name):
     in the 'logs/main.log' file and to the console (with an INFO
     level).
 
+    Log files are rotated by size and day, older segments being
+    compressed in 'logs/archives/{name}/' (see `world.logfile`).
+
     """
     if not name:
         address = "main"
-        filename = "server/logs/main.log"
         name = "avenew"
     else:
         address = name
-        filename = "server/logs/" + name + ".log"
         name = "avenew." + name
 
     if address in loggers:
         return loggers[address]
 
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    logger.setLevel(LOG_LEVELS.get(address, LOG_LEVEL))
+    logger.addFilter(FILTER)
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    handlers = []
 
     # If it's the main logger, create a stream handler
     if name == "avenew":
         handler = logging.StreamHandler()
         handler.setLevel(logging.INFO)
-        logger.addHandler(handler)
+        handlers.append(handler)
 
-        # Set a FileHandler for error messages
-        handler = logging.FileHandler("server/logs/error.log", encoding="utf-8")
+        # Set a handler for error messages
+        handler = SegmentHandler("error", autoflush=False)
         handler.setLevel(logging.ERROR)
         handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        handlers.append(handler)
 
     # Create the file handler
-    handler = logging.FileHandler(filename, encoding="utf-8")
+    handler = SegmentHandler(address, autoflush=False)
     handler.setLevel(logging.DEBUG)
     handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    handlers.append(handler)
+
+    # The handlers are called by the writer thread
+    logger.addHandler(QueueHandler(handlers, WRITER))
     loggers[address] = logger
     return logger
 
+def get_levels():
+    """
+    Return the levels of the loggers.
+
+    Returns:
+        levels (dict): the level name (like 'INFO') of each logger,
+                by name (like 'main' or 'command').
+
+    """
+    return dict((name, logging.getLevelName(logger.level))
+            for name, logger in loggers.items())
+
+def set_level(name, level):
+    """
+    Change the level of a logger while the game runs.
+
+    The level isn't kept when the server reloads: change `LOG_LEVELS`
+    in the settings for that.
+
+    Args:
+        name (str): the logger name, like 'main' or 'command'.
+        level (str): the level name, like 'DEBUG' or 'WARNING'.
+
+    Raises:
+        KeyError: the logger doesn't exist.
+        ValueError: the level is invalid.
+
+    """
+    logger = loggers[name]
+    number = logging.getLevelName(level.upper())
+    if not isinstance(number, int):
+        raise ValueError("invalid level: {!r}".format(level))
+
+    logger.setLevel(number)
+
 MONTHS = [
     "January",
     "February",
@@ -123,7 +452,7 @@ def begin():
         logger.propagate = True
 
 def end():
-    """Log the end of the session to every logger."""
+    """Log the end of the session to every logger and flush them."""
     formats = get_date_formats()
 
     # Message to be sent
@@ -135,6 +464,8 @@ def end():
         logger.info(message)
         logger.propagate = True
 
+    WRITER.flush()
+
 # Prepare the different loggers
 main = logger("")  # Main logger
 app = logger("app")  # Main logger
@@ -143,3 +474,6 @@ login = logger("login")  # Main logger
 batch = logger("batch")  # Main logger
 tasks = logger("tasks")  # Main logger
 character = logger("character")  # Main logger
+query = logger("query")  # Query budget (see world.querywatch)
+lag = logger("lag")  # Reactor lag (see world.watchdog)
+deploy = logger("deploy")  # Deployments (see world.deploy)
@@ -0,0 +1,579 @@
+# -*- coding: utf-8 -*-
+
+"""
+Rotating, compressed log files with a time index.
+
+A `SegmentedLog` appends lines to an active file (`server/logs/{name}.log`).
+When this file grows beyond `MAX_SIZE` bytes, or when the day changes,
+it is closed and compressed into a segment in
+`server/logs/archives/{name}/`.  Compression happens in a background
+thread, so the caller only pays for a rename.
+
+A segment is a sequence of independent gzip members, one for every
+`BLOCK_SIZE` bytes of text (the file itself remains a valid gzip file).
+The index (`{name}.index` beside the segments) is a JSON-lines file
+with one entry per segment:
+
+    {"segment": "hrp-20181104-200722.log.gz", "start": 1541358442.0,
+     "end": 1541401200.0, "lines": 2048, "blocks": [[1541358442.0, 0], ...]}
+
+Each block holds its first timestamp and its compressed offset.  Reading
+a time range (see `SegmentedLog.read`) therefore only opens the segments
+that overlap it and only decompresses the blocks that can hold it.
+
+Example:
+
+>>> from world.logfile import get_log
+>>> log = get_log("channel_hrp")
+>>> log.write("2018-11-04 20:07:22 [-] [Hrp] Kredh: salut")
+>>> lines = log.read(start, end)
+
+"""
+
+from datetime import date, datetime
+import glob
+import io
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+# Imported beforehand, strptime is not thread-safe on first call
+import _strptime
+
+## Constants
+LOG_DIR = "server/logs"
+MAX_SIZE = 10 * 1024 * 1024
+BLOCK_SIZE = 64 * 1024
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+TIME_LENGTH = 19
+JSON_PREFIX = '{"time": "'
+SEEK_THRESHOLD = 64 * 1024
+
+logs = {}
+
+def get_log(name):
+    """
+    Return an existing or new segmented log.
+
+    Args:
+        name (str): the log name, like 'main' or 'channel_hrp'.  The
+                active file will be 'server/logs/{name}.log'.
+
+    Returns:
+        log (SegmentedLog): the segmented log for this name.
+
+    """
+    if name not in logs:
+        logs[name] = SegmentedLog(name)
+
+    return logs[name]
+
+def find_log(name, directory=LOG_DIR):
+    """
+    Return an existing log, without creating one.
+
+    A log exists if it was opened in this process (by a logger or a
+    channel) or if it has an active file or archives in the log
+    directory.  Names that could lead outside of this directory are
+    refused.
+
+    Args:
+        name (str): the log name, like 'main' or 'channel_hrp'.
+        directory (str, optional): the log directory.
+
+    Returns:
+        log (SegmentedLog or None): the log, or None if it doesn't exist.
+
+    """
+    if name in logs:
+        return logs[name]
+
+    if not name or name.startswith(".") or os.path.basename(name) != name or "\\" in name:
+        return None
+
+    if not (os.path.isfile(os.path.join(directory, name + ".log")) or
+            os.path.isdir(os.path.join(directory, "archives", name))):
+        return None
+
+    return get_log(name)
+
+def parse_timestamp(line):
+    """
+    Return the timestamp at the beginning of a log line, or None.
+
+    Lines written by the loggers or the channels begin with a
+    'YYYY-mm-dd HH:MM:SS' date (the milliseconds or what follows are
+    ignored).  JSON lines begin with a 'time' field holding the same
+    date.  Continuation lines (like tracebacks) have no timestamp.
+
+    Args:
+        line (str): the line to parse.
+
+    Returns:
+        timestamp (float or None): the timestamp in seconds since epoch.
+
+    """
+    if line.startswith(JSON_PREFIX):
+        line = line[len(JSON_PREFIX):]
+
+    if len(line) < TIME_LENGTH or not line[:1].isdigit():
+        return None
+
+    try:
+        moment = datetime.strptime(line[:TIME_LENGTH], TIME_FORMAT)
+    except ValueError:
+        return None
+
+    return time.mktime(moment.timetuple())
+
+def format_timestamp(timestamp):
+    """Return the timestamp formatted like the beginning of a log line."""
+    return datetime.fromtimestamp(timestamp).strftime(TIME_FORMAT)
+
+
+class SegmentedLog(object):
+
+    """
+    A log file rotated by size and day, with compressed segments.
+
+    Writing and rotating are protected by a lock, so a log can be
+    shared by the loggers and the channels, whatever the thread.
+
+    """
+
+    def __init__(self, name, directory=LOG_DIR, max_size=MAX_SIZE,
+            block_size=BLOCK_SIZE):
+        self.name = name
+        self.directory = directory
+        self.path = os.path.join(directory, name + ".log")
+        self.archives = os.path.join(directory, "archives", name)
+        self.index_path = os.path.join(self.archives, name + ".index")
+        self.max_size = max_size
+        self.block_size = block_size
+        self.lock = threading.RLock()
+        self.index_lock = threading.Lock()
+        self.compress_lock = threading.Lock()
+        self.recovered = False
+        self.file = None
+        self.size = 0
+        self.day = None
+
+    def __repr__(self):
+        return "<SegmentedLog {!r}>".format(self.name)
+
+    def open(self):
+        """Open the active file, compressing forgotten pending files."""
+        for directory in (self.directory, self.archives):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+        self.file = open(self.path, "ab")
+        self.size = os.path.getsize(self.path)
+        self.day = None
+        if self.size:
+            self.day = date.fromtimestamp(os.path.getmtime(self.path))
+
+        # Pending files are left when the server stops during a compression
+        if not self.recovered:
+            self.recovered = True
+            for path in sorted(glob.glob(os.path.join(self.archives, "*.pending"))):
+                self._start_compression(path)
+
+    def write(self, line, when=None, flush=True):
+        """
+        Write a line in the active file, rotating it if needed.
+
+        Args:
+            line (str): the line to write.  It should begin with a
+                    timestamp, or it will be considered part of the
+                    previous line when reading the log.
+            when (float, optional): the time of the line (now by default).
+            flush (bool, optional): flush the file after writing.
+
+        """
+        when = time.time() if when is None else when
+        if isinstance(line, unicode):
+            line = line.encode("utf-8")
+
+        if not line.endswith(b"\n"):
+            line += b"\n"
+
+        day = date.fromtimestamp(when)
+        with self.lock:
+            if self.file is None:
+                self.open()
+
+            if self.size and (self.size + len(line) > self.max_size or
+                    day != self.day):
+                self.rotate()
+                self.open()
+
+            self.day = day
+            self.file.write(line)
+            if flush:
+                self.file.flush()
+            self.size += len(line)
+
+    def flush(self):
+        """Flush the active file."""
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self):
+        """Close the active file (it will be re-opened when needed)."""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def rotate(self):
+        """
+        Rotate the active file.
+
+        The active file is renamed and compressed in a background thread.
+        A new active file is created on the next write.
+
+        """
+        with self.lock:
+            self.close()
+            if not os.path.exists(self.path) or not os.path.getsize(self.path):
+                return
+
+            if not os.path.isdir(self.archives):
+                os.makedirs(self.archives)
+
+            pending = os.path.join(self.archives, "{}-{}.pending".format(
+                    self.name, datetime.now().strftime("%Y%m%d-%H%M%S%f")))
+            os.rename(self.path, pending)
+            self.size = 0
+            self.day = None
+
+        self._start_compression(pending)
+
+    def segments(self):
+        """Return the index entries, oldest first."""
+        entries = []
+        with self.index_lock:
+            if not os.path.exists(self.index_path):
+                return entries
+
+            with io.open(self.index_path, "r", encoding="utf-8") as index:
+                for line in index:
+                    line = line.strip()
+                    if line:
+                        entries.append(json.loads(line))
+
+        entries.sort(key=lambda entry: entry["start"])
+        return entries
+
+    def read(self, start, end):
+        """
+        Return the lines written between two timestamps.
+
+        Only the segments overlapping this period are opened, and only
+        the blocks that can contain lines of this period are decompressed.
+
+        Args:
+            start (float): the beginning of the period (included).
+            end (float): the end of the period (excluded).
+
+        Returns:
+            lines (list of unicode): the lines, oldest first.
+
+        """
+        lines = []
+        for entry in self.segments():
+            if entry["end"] < start or entry["start"] >= end:
+                continue
+
+            path = os.path.join(self.archives, entry["segment"])
+            blocks = entry["blocks"]
+            with open(path, "rb") as segment:
+                for i, (first, offset) in enumerate(blocks):
+                    following = blocks[i + 1] if i + 1 < len(blocks) else None
+                    last = following[0] if following else entry["end"]
+                    if last < start or first >= end:
+                        continue
+
+                    segment.seek(offset)
+                    data = segment.read(following[1] - offset if following else -1)
+                    text = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+                    lines.extend(_select(text.splitlines(), start, end, first))
+
+        # Pending and active files are not indexed, they are searched
+        self.flush()
+        paths = sorted(glob.glob(os.path.join(self.archives, "*.pending")))
+        paths.append(self.path)
+        for path in paths:
+            if os.path.exists(path) and os.path.getmtime(path) >= start:
+                lines.extend(_read_file(path, start, end))
+
+        return [line.decode("utf-8", "replace") for line in lines]
+
+    def tail(self, count, offset=0):
+        """
+        Return the last lines of the log.
+
+        Args:
+            count (int): the number of lines to return.
+            offset (int, optional): the number of lines to skip from the end.
+
+        Returns:
+            lines (list of unicode): the lines, oldest first.
+
+        """
+        needed = count + offset
+        self.flush()
+        lines = _tail_file(self.path, needed)
+        if len(lines) < needed:
+            # Look in the most recent segments
+            for entry in reversed(self.segments()):
+                path = os.path.join(self.archives, entry["segment"])
+                with open(path, "rb") as segment:
+                    text = zlib.decompress(segment.read(), 16 + zlib.MAX_WBITS)
+
+                lines = text.splitlines()[-(needed - len(lines)):] + lines
+                if len(lines) >= needed:
+                    break
+
+        lines = lines[-needed:]
+        if offset:
+            lines = lines[:-offset]
+
+        return [line.decode("utf-8", "replace") for line in lines]
+
+    def _start_compression(self, pending):
+        """Compress a pending file in a background thread."""
+        thread = threading.Thread(target=self._compress, args=(pending, ),
+                name="compress-" + self.name)
+        thread.daemon = True
+        thread.start()
+
+    def _compress(self, pending):
+        """
+        Compress a pending file into a segment and index it.
+
+        Compressions of the same log are done one at a time.
+
+        Args:
+            pending (str): the path of the file to compress.
+
+        """
+        with self.compress_lock:
+            if os.path.exists(pending):
+                self._compress_pending(pending)
+
+    def _compress_pending(self, pending):
+        """Compress a pending file, the compression lock being held."""
+        try:
+            with open(pending, "rb") as source:
+                lines = source.read().splitlines(True)
+
+            # Group the lines in blocks beginning with a timestamp
+            blocks = []
+            block = []
+            size = 0
+            first = None
+            last = None
+            for line in lines:
+                timestamp = parse_timestamp(line)
+                if timestamp is not None:
+                    if size >= self.block_size:
+                        blocks.append((first, block))
+                        block = []
+                        size = 0
+                        first = None
+
+                    last = timestamp
+                    if first is None:
+                        first = timestamp
+
+                block.append(line)
+                size += len(line)
+
+            if block:
+                blocks.append((first, block))
+
+            start = blocks[0][0] if blocks else None
+            if start is None:
+                start = os.path.getmtime(pending)
+            if last is None:
+                last = start
+
+            name = "{}-{}.log.gz".format(self.name,
+                    datetime.fromtimestamp(start).strftime("%Y%m%d-%H%M%S"))
+            path = os.path.join(self.archives, name)
+            number = 1
+            while os.path.exists(path):
+                number += 1
+                path = os.path.join(self.archives, name.replace(
+                        ".log.gz", "-{}.log.gz".format(number)))
+
+            index = []
+            previous = start
+            with open(path + ".tmp", "wb") as segment:
+                for first, block in blocks:
+                    first = previous if first is None else first
+                    index.append([first, segment.tell()])
+                    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                    segment.write(compressor.compress(b"".join(block)))
+                    segment.write(compressor.flush())
+                    previous = first
+
+            os.rename(path + ".tmp", path)
+            entry = {
+                    "segment": os.path.basename(path),
+                    "start": start,
+                    "end": last,
+                    "lines": len(lines),
+                    "blocks": index,
+            }
+
+            with self.index_lock:
+                with io.open(self.index_path, "a", encoding="utf-8") as index_file:
+                    index_file.write(json.dumps(entry, sort_keys=True).decode("utf-8") + u"\n")
+
+            os.remove(pending)
+        except Exception:
+            logging.getLogger("avenew").exception(
+                    "cannot compress {!r}".format(pending))
+
+
+class SegmentHandler(logging.Handler):
+
+    """
+    A logging handler writing in a segmented log.
+
+    If `autoflush` is False, the file is only flushed when the handler
+    is (the writer thread of `world.log` flushes it regularly).
+
+    """
+
+    def __init__(self, name, level=logging.NOTSET, autoflush=True):
+        logging.Handler.__init__(self, level)
+        self.log = get_log(name)
+        self.autoflush = autoflush
+
+    def emit(self, record):
+        try:
+            self.log.write(self.format(record), record.created, self.autoflush)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.log.flush()
+
+    def close(self):
+        self.log.close()
+        logging.Handler.close(self)
+
+
+def _select(lines, start, end, timestamp=None):
+    """
+    Select the lines between two timestamps.
+
+    Lines without timestamp are considered part of the previous line.
+
+    Args:
+        lines (list of str): the lines to browse.
+        start (float): the beginning of the period (included).
+        end (float): the end of the period (excluded).
+        timestamp (float, optional): the timestamp of the first lines,
+                if they don't have one.
+
+    Returns:
+        selected (list of str): the lines of this period.
+
+    """
+    selected = []
+    for line in lines:
+        timestamp = parse_timestamp(line) or timestamp
+        if timestamp is not None and start <= timestamp < end:
+            selected.append(line)
+
+    return selected
+
+def _read_file(path, start, end):
+    """
+    Return the lines of a file written between two timestamps.
+
+    The lines being sorted by time, the beginning of the period is
+    found by binary search, and reading stops at its end.
+
+    Args:
+        path (str): the path of the file to read.
+        start (float): the beginning of the period (included).
+        end (float): the end of the period (excluded).
+
+    Returns:
+        selected (list of str): the lines of this period.
+
+    """
+    with open(path, "rb") as file:
+        low = 0
+        file.seek(0, os.SEEK_END)
+        high = file.tell()
+        while high - low > SEEK_THRESHOLD:
+            middle = (low + high) // 2
+            file.seek(middle)
+            file.readline()
+            timestamp = None
+            while timestamp is None:
+                line = file.readline()
+                if not line:
+                    break
+                timestamp = parse_timestamp(line)
+
+            if timestamp is not None and timestamp < start:
+                low = middle
+            else:
+                high = middle
+
+        file.seek(low)
+        if low:
+            file.readline()
+
+        selected = []
+        timestamp = None
+        for line in file:
+            timestamp = parse_timestamp(line) or timestamp
+            if timestamp is None or timestamp < start:
+                continue
+            if timestamp >= end:
+                break
+            selected.append(line.rstrip(b"\r\n"))
+
+    return selected
+
+def _tail_file(path, count, chunk=8192):
+    """
+    Return the last lines of a file, reading it from the end.
+
+    Args:
+        path (str): the path of the file to read.
+        count (int): the number of lines to read.
+        chunk (int, optional): the number of bytes to read at once.
+
+    Returns:
+        lines (list of str): the last lines, oldest first.
+
+    """
+    if not os.path.exists(path):
+        return []
+
+    with open(path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= count:
+            size = min(chunk, position)
+            position -= size
+            file.seek(position)
+            data = file.read(size) + data
+
+    lines = data.splitlines()
+    return lines[-count:] if count else []
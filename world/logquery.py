@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+Search the logs by time and field.
+
+The logs are searched by time without reading them entirely: the
+compressed segments are indexed by time, and the active files are
+searched by binary search (see `world.logfile`).  Entries of the
+period are then filtered by field (JSON lines, see `LOG_FORMAT` in
+`world.log`) or by level and words (text lines).
+
+From the game directory:
+
+    python -m world.logquery login --since 1h level=error
+    python -m world.logquery main --start "2018-11-04 20:00" account=kredh timeout
+
+The `logs` admin command does the same in the game.
+
+"""
+
+import argparse
+from datetime import datetime
+import json
+import re
+import sys
+import time
+
+from world.logfile import find_log, parse_timestamp
+
+## Constants
+RE_PERIOD = re.compile(r"^(\d+)([smhdj])$", re.I)
+RE_LEVEL = re.compile(r"^\S+ \S+ \[(\w+)\]")
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "j": 86400}
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+def parse_period(period):
+    """
+    Return the number of seconds of a period like '30m' or '2h'.
+
+    Args:
+        period (str): a number followed by s, m, h or d (or j).
+
+    Returns:
+        seconds (int or None): the number of seconds, None if invalid.
+
+    """
+    match = RE_PERIOD.match(period.strip())
+    if match is None:
+        return None
+
+    return int(match.group(1)) * UNITS[match.group(2).lower()]
+
+def parse_date(text):
+    """Return the timestamp of a date like '2018-11-04 20:00', or None."""
+    for date_format in DATE_FORMATS:
+        try:
+            moment = datetime.strptime(text.strip(), date_format)
+        except ValueError:
+            continue
+
+        return time.mktime(moment.timetuple())
+
+    return None
+
+def parse_filters(words):
+    """
+    Split search words in field filters and free words.
+
+    Args:
+        words (list of str): words like 'level=error' or 'timeout'.
+
+    Returns:
+        fields (dict): the field filters, lowercase.
+        words (list of str): the other words, lowercase.
+
+    """
+    fields = {}
+    others = []
+    for word in words:
+        if "=" in word:
+            field, value = word.split("=", 1)
+            fields[field.strip().lower()] = value.strip().lower()
+        elif word:
+            others.append(word.lower())
+
+    return fields, others
+
+def group_entries(lines):
+    """Group lines in entries, continuation lines joining the previous one."""
+    entries = []
+    for line in lines:
+        if entries and parse_timestamp(line) is None:
+            entries[-1].append(line)
+        else:
+            entries.append([line])
+
+    return entries
+
+def match_entry(entry, fields, words):
+    """
+    Return whether a log entry matches filters.
+
+    Args:
+        entry (list of unicode): the lines of the entry.
+        fields (dict): the field filters (exact, ignoring case).
+        words (list of str): words to find in the entry.
+
+    Returns:
+        matched (bool): whether the entry matches all the filters.
+
+    """
+    first = entry[0]
+    if first.startswith(u"{"):
+        try:
+            data = json.loads(first)
+        except ValueError:
+            data = {}
+    else:
+        # Text lines only have a level
+        match = RE_LEVEL.match(first)
+        data = {"level": match.group(1)} if match else {}
+
+    for field, value in fields.items():
+        if field not in data or unicode(data[field]).lower() != value:
+            return False
+
+    if words:
+        text = u"\n".join(entry).lower()
+        if not all(word in text for word in words):
+            return False
+
+    return True
+
+def query(name, start, end=None, filters=(), limit=None):
+    """
+    Search a log.
+
+    Args:
+        name (str): the log name, like 'main' or 'login'.
+        start (float): the beginning of the period.
+        end (float, optional): the end of the period (now by default).
+        filters (list of str, optional): field filters ('level=error')
+                and words to find.
+        limit (int, optional): the maximum number of entries, the
+                most recent being kept.
+
+    Returns:
+        entries (list of list of unicode): the matching entries, each
+                being a list of lines.
+
+    Raises:
+        KeyError: if the log doesn't exist (see `world.logfile.find_log`).
+
+    """
+    log = find_log(name)
+    if log is None:
+        raise KeyError(name)
+
+    end = time.time() + 1 if end is None else end
+    fields, words = parse_filters(filters)
+    lines = log.read(start, end)
+    entries = [entry for entry in group_entries(lines)
+            if match_entry(entry, fields, words)]
+    if limit:
+        entries = entries[-limit:]
+
+    return entries
+
+def main(args=None):
+    """Search a log from the command line."""
+    parser = argparse.ArgumentParser(description="Search a log by time and field.")
+    parser.add_argument("name", help="the log name, like 'main' or 'login'")
+    parser.add_argument("filters", nargs="*", help="field=value filters or words")
+    parser.add_argument("--since", default="1h", help="the period to search, like 30m or 2d")
+    parser.add_argument("--start", help="the beginning of the period (YYYY-mm-dd HH:MM)")
+    parser.add_argument("--end", help="the end of the period (YYYY-mm-dd HH:MM)")
+    parser.add_argument("--limit", type=int, help="the maximum number of entries")
+    options, others = parser.parse_known_args(args)
+    if any(other.startswith("-") for other in others):
+        parser.error("unrecognized arguments: " + " ".join(others))
+
+    # Filters may follow the options
+    options.filters.extend(others)
+
+    end = parse_date(options.end) if options.end else None
+    if options.start:
+        start = parse_date(options.start)
+    else:
+        seconds = parse_period(options.since)
+        start = None if seconds is None else (end or time.time()) - seconds
+
+    if start is None or (options.end and end is None):
+        parser.error("invalid period")
+
+    try:
+        entries = query(options.name, start, end, options.filters, options.limit)
+    except KeyError:
+        parser.error("unknown log: {}".format(options.name))
+
+    for entry in entries:
+        for line in entry:
+            sys.stdout.write(line.encode("utf-8") + "\n")
+
+
+if __name__ == "__main__":
+    main()
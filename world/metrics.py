@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+"""
+Runtime metrics of the game.
+
+Counters, gauges and histograms are created once (usually at module
+level) and updated on the hot paths.  They are plain numbers updated
+from the reactor thread, so they don't need any lock: reading them from
+another place might give a slightly outdated value, but never a
+broken one.
+
+Example:
+
+>>> from world.metrics import counter
+>>> throttled = counter("channel_throttled", "Throttled channel messages",
+...         channel="hrp")
+>>> throttled.incr()
+>>> throttled.value
+1
+>>> from world.metrics import histogram
+>>> wall = histogram("command_wall_seconds", "Command duration", command="look")
+>>> wall.record(0.0123)
+>>> wall.percentile(99)  # About 0.0123
+
+"""
+
+from array import array
+
+from world.snapshot import register
+
+counters = {}
+gauges = {}
+histograms = {}
+
+def counter(name, description="", **labels):
+    """
+    Return an existing or new counter.
+
+    Args:
+        name (str): the counter name, like 'channel_throttled'.
+        description (str, optional): a short description of the counter.
+
+    Kwargs:
+        Labels to distinguish counters of the same name, like
+        `channel="hrp"`.
+
+    Returns:
+        counter (Counter): the counter for this name and labels.
+
+    """
+    key = (name, tuple(sorted(labels.items())))
+    if key not in counters:
+        counters[key] = Counter(name, description, labels)
+
+    return counters[key]
+
+def get_counters(name):
+    """Return the counters of this name, whatever their labels."""
+    return [counter for (counter_name, _), counter in sorted(counters.items())
+            if counter_name == name]
+
+def gauge(name, description="", **labels):
+    """
+    Return an existing or new gauge.
+
+    Args:
+        name (str): the gauge name, like 'input_queue_depth'.
+        description (str, optional): a short description of the gauge.
+
+    Kwargs:
+        Labels to distinguish gauges of the same name.
+
+    Returns:
+        gauge (Gauge): the gauge for this name and labels.
+
+    """
+    key = (name, tuple(sorted(labels.items())))
+    if key not in gauges:
+        gauges[key] = Gauge(name, description, labels)
+
+    return gauges[key]
+
+def get_gauges(name):
+    """Return the gauges of this name, whatever their labels."""
+    return [gauge for (gauge_name, _), gauge in sorted(gauges.items())
+            if gauge_name == name]
+
+def histogram(name, description="", **labels):
+    """
+    Return an existing or new histogram.
+
+    Args:
+        name (str): the histogram name, like 'command_wall_seconds'.
+        description (str, optional): a short description of the histogram.
+
+    Kwargs:
+        Labels to distinguish histograms of the same name, like
+        `command="look"`.
+
+    Returns:
+        histogram (Histogram): the histogram for this name and labels.
+
+    """
+    key = (name, tuple(sorted(labels.items())))
+    if key not in histograms:
+        histograms[key] = Histogram(name, description, labels)
+
+    return histograms[key]
+
+def get_histograms(name):
+    """Return the histograms of this name, whatever their labels."""
+    return [histogram for (histogram_name, _), histogram in sorted(histograms.items())
+            if histogram_name == name]
+
+def snapshot():
+    """Return the counters and histograms, to keep them across reloads."""
+    return {
+        "counters": [(metric.name, metric.description, metric.labels, metric.value)
+                for metric in counters.values()],
+        "histograms": [(metric.name, metric.description, metric.labels,
+                metric.counts.tolist(), metric.count, metric.total, metric.max)
+                for metric in histograms.values() if metric.count],
+    }
+
+def restore(data):
+    """Add the saved counters and histograms to the current ones."""
+    for name, description, labels, value in data["counters"]:
+        counter(name, description, **labels).incr(value)
+
+    for name, description, labels, counts, count, total, maximum in data["histograms"]:
+        metric = histogram(name, description, **labels)
+        for index, number in enumerate(counts):
+            metric.counts[index] += number
+        metric.count += count
+        metric.total += total
+        metric.max = max(metric.max, maximum)
+
+
+class Counter(object):
+
+    """A counter, only going up."""
+
+    __slots__ = ("name", "description", "labels", "value")
+
+    def __init__(self, name, description="", labels=None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.value = 0
+
+    def __repr__(self):
+        return "<Counter {} {}={}>".format(self.name, self.labels, self.value)
+
+    def incr(self, amount=1):
+        """Increment the counter."""
+        self.value += amount
+
+
+class Gauge(object):
+
+    """A gauge, going up and down, which keeps its maximum."""
+
+    __slots__ = ("name", "description", "labels", "value", "max")
+
+    def __init__(self, name, description="", labels=None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.value = 0
+        self.max = 0
+
+    def __repr__(self):
+        return "<Gauge {} {}={}>".format(self.name, self.labels, self.value)
+
+    def set(self, value):
+        """Set the value of the gauge."""
+        self.value = value
+        if value > self.max:
+            self.max = value
+
+
+class Histogram(object):
+
+    """
+    A histogram of durations with a fixed size, in the HDR style.
+
+    Values are counted in microseconds, in log-linear buckets: each
+    power of two is divided in `PRECISION` buckets, so the relative
+    error on a percentile is below 1 / `PRECISION`, whatever the value.
+    Values from one microsecond to several hours are covered by about a
+    thousand buckets.
+
+    """
+
+    PRECISION_BITS = 5
+    PRECISION = 1 << PRECISION_BITS
+    MAX_SHIFT = 32
+    UNIT = 1e-6
+
+    __slots__ = ("name", "description", "labels", "counts", "count", "total", "max")
+
+    def __init__(self, name, description="", labels=None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.counts = array("L", [0]) * ((self.MAX_SHIFT + 2) * self.PRECISION)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def __repr__(self):
+        return "<Histogram {} {} count={}>".format(self.name, self.labels, self.count)
+
+    def record(self, value):
+        """
+        Record a value.
+
+        Args:
+            value (float): the value, in seconds.
+
+        """
+        units = int(value / self.UNIT)
+        if units < 2 * self.PRECISION:
+            index = max(units, 0)
+        else:
+            shift = min(units.bit_length() - self.PRECISION_BITS - 1, self.MAX_SHIFT)
+            index = (shift + 1) * self.PRECISION + min(units >> shift, 2 * self.PRECISION - 1) - self.PRECISION
+
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        Return a percentile of the recorded values.
+
+        Args:
+            percent (float): the percentile, like 50 or 99.
+
+        Returns:
+            value (float): the value in seconds (0 if nothing was recorded).
+
+        """
+        if not self.count:
+            return 0.0
+
+        rank = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._value(index), self.max)
+
+        return self.max
+
+    def reset(self):
+        """Forget the recorded values."""
+        self.counts = array("L", [0]) * len(self.counts)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _value(self, index):
+        """Return the middle value of a bucket, in seconds."""
+        if index < 2 * self.PRECISION:
+            return index * self.UNIT
+
+        shift = index // self.PRECISION - 1
+        mantissa = index % self.PRECISION + self.PRECISION
+        low = mantissa << shift
+        return (low + (1 << shift) / 2.0) * self.UNIT
+
+
+# The histogram buckets depend on the precision
+register("metrics", snapshot, restore, version=(1, Histogram.PRECISION_BITS,
+        Histogram.MAX_SHIFT))
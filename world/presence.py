@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+"""
+Presence roster of the connected characters.
+
+The roster keeps the puppeted characters sorted by key, with their AFK
+state.  It is updated when a character is puppeted, unpuppeted or
+renamed and when its AFK state changes, and keeps the table displayed
+by the `who` command until the next change.  Displaying it is
+therefore free between changes, however many players are online.
+
+Example:
+
+>>> from world.presence import ROSTER
+>>> ROSTER.add(character)
+>>> ROSTER.set_afk(character, "jusqu'à 20h")
+>>> text = ROSTER.render()
+
+"""
+
+from bisect import bisect_left, insort
+
+from world.attributes import prefetch_attributes
+
+class Roster(object):
+
+    """
+    The sorted list of puppeted characters.
+
+    The roster is built from the sessions on first use (after a reload,
+    the characters aren't puppeted again), reading their AFK state in
+    one query, then updated incrementally.
+
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.order = []
+        self.text = None
+        self.built = False
+
+    def __len__(self):
+        self.build()
+        return len(self.entries)
+
+    def __contains__(self, puppet):
+        self.build()
+        return puppet.id in self.entries
+
+    def build(self):
+        """Build the roster from the sessions, if not done yet."""
+        if self.built:
+            return
+
+        from evennia.server.sessionhandler import SESSIONS
+        self.built = True
+        puppets = [session.puppet for session in SESSIONS.get_sessions() if session.puppet]
+        prefetch_attributes(puppets, ["afk"])
+        for puppet in puppets:
+            self.add(puppet)
+
+    def add(self, puppet, afk=None):
+        """
+        Add a character to the roster, if not present.
+
+        Args:
+            puppet (Character): the puppeted character.
+            afk (bool or str, optional): the AFK state (read on the
+                    character if not specified).
+
+        """
+        if puppet.id in self.entries:
+            return
+
+        if afk is None:
+            afk = puppet.db.afk
+
+        self.entries[puppet.id] = [puppet.key, afk]
+        insort(self.order, (puppet.key, puppet.id))
+        self.text = None
+
+    def remove(self, puppet):
+        """Remove a character from the roster, if present."""
+        entry = self.entries.pop(puppet.id, None)
+        if entry is None:
+            return
+
+        position = bisect_left(self.order, (entry[0], puppet.id))
+        del self.order[position]
+        self.text = None
+
+    def rename(self, puppet):
+        """
+        Sort a renamed character under its new key, if present.
+
+        Args:
+            puppet (Character): the character, with its new key.
+
+        """
+        entry = self.entries.get(puppet.id)
+        if entry is None or entry[0] == puppet.key:
+            return
+
+        del self.order[bisect_left(self.order, (entry[0], puppet.id))]
+        entry[0] = puppet.key
+        insort(self.order, (puppet.key, puppet.id))
+        self.text = None
+
+    def set_afk(self, puppet, afk):
+        """
+        Change the AFK state of a character.
+
+        Args:
+            puppet (Character): the character.
+            afk (bool or str): the AFK state, a string being the AFK
+                    message, a false value meaning not AFK.
+
+        """
+        entry = self.entries.get(puppet.id)
+        if entry is not None and entry[1] != afk:
+            entry[1] = afk
+            self.text = None
+
+    def get_afk(self, puppet):
+        """Return the AFK state of a character in the roster."""
+        self.build()
+        entry = self.entries.get(puppet.id)
+        return entry[1] if entry else None
+
+    def render(self):
+        """Return the table of connected characters."""
+        self.build()
+        if self.text is not None:
+            return self.text
+
+        lines = []
+        for key, id in self.order:
+            afk = self.entries[id][1]
+            status = ""
+            if afk:
+                status = "AFK"
+                if isinstance(afk, basestring):
+                    status += " (" + afk + ")"
+
+            lines.append("|   {:<15} {:<55} |".format(key, status))
+
+        count = len(self.order)
+        lines.insert(0, "+" + "-" * 75 + "+")
+        lines.append("+" + "-" * 75 + "+")
+        lines.append("|   " + "{} utilisateur{s} connecté{s}".format(count, s="s" if count > 1 else "").ljust(72) + " |")
+        lines.append("+" + "-" * 75 + "+")
+        self.text = "\n".join(lines)
+        return self.text
+
+
+ROSTER = Roster()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+Sampling profiler of the live server.
+
+The profiler runs in a background thread: it reads the stack of the
+reactor thread (with `sys._current_frames`) at a fixed rate for a few
+seconds, without slowing the game down much.  Stacks are counted and
+written in the collapsed format of flamegraph tools, in
+'server/logs/profile-{date}.folded':
+
+    flamegraph.pl server/logs/profile-20181104-200000.folded > profile.svg
+
+A summary gives the frames of the game modules (`GAME_MODULES`) found
+in the most samples.  The profiler is used by the `profile` command.
+
+"""
+
+from collections import Counter
+from datetime import datetime
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+from twisted.internet import reactor
+
+from world.logfile import LOG_DIR
+
+## Constants
+PROFILE_RATE = getattr(settings, "PROFILE_RATE", 100)
+PROFILE_DURATION = getattr(settings, "PROFILE_DURATION", 30)
+GAME_MODULES = ("commands.", "typeclasses.", "world.", "web.", "server.conf.")
+
+def collapse(frame):
+    """
+    Return a stack in the collapsed format.
+
+    Args:
+        frame (frame): the innermost frame.
+
+    Returns:
+        stack (str): the functions, outermost first, separated by
+                semicolons, like 'module.function;module.function'.
+
+    """
+    names = []
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "?")
+        names.append("{}.{}".format(module, frame.f_code.co_name))
+        frame = frame.f_back
+
+    names.reverse()
+    return ";".join(names).replace(" ", "_")
+
+
+class SamplingProfiler(object):
+
+    """
+    A profiler sampling the stack of a thread.
+
+    Only one profile runs at a time.  When it's done, the stacks are
+    written and the callback is called in the reactor thread.
+
+    """
+
+    def __init__(self):
+        self.thread = None
+        self.stopped = False
+        self.ident = None
+        self.stacks = Counter()
+        self.samples = 0
+        self.path = None
+
+    @property
+    def running(self):
+        """Return whether a profile is running."""
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration=PROFILE_DURATION, rate=PROFILE_RATE, callback=None):
+        """
+        Start profiling the current thread (usually the reactor).
+
+        Args:
+            duration (float, optional): the duration, in seconds.
+            rate (int, optional): the number of samples per second.
+            callback (callable, optional): called with the profiler
+                    when the profile is written.
+
+        Returns:
+            started (bool): False if a profile is already running.
+
+        """
+        if self.running:
+            return False
+
+        self.ident = threading.current_thread().ident
+        self.stopped = False
+        self.stacks = Counter()
+        self.samples = 0
+        self.path = None
+        self.thread = threading.Thread(target=self.run, name="profiler",
+                args=(duration, rate, callback))
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Stop the running profile early (it's still written)."""
+        self.stopped = True
+
+    def run(self, duration, rate, callback):
+        """Sample the stacks, in the profiler thread."""
+        interval = 1.0 / rate
+        end = time.time() + duration
+        while not self.stopped and time.time() < end:
+            frame = sys._current_frames().get(self.ident)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+                self.samples += 1
+            del frame
+            time.sleep(interval)
+
+        self.write()
+        if callback is not None:
+            reactor.callFromThread(callback, self)
+
+    def write(self):
+        """Write the stacks in the collapsed format."""
+        name = "profile-{}.folded".format(datetime.now().strftime("%Y%m%d-%H%M%S"))
+        self.path = os.path.join(LOG_DIR, name)
+        with open(self.path, "w") as file:
+            for stack, count in sorted(self.stacks.items()):
+                file.write("{} {}\n".format(stack, count))
+
+    def summary(self, count=10, modules=GAME_MODULES):
+        """
+        Return the game frames found in the most samples.
+
+        Args:
+            count (int, optional): the number of frames to return.
+            modules (tuple of str, optional): the module prefixes.
+
+        Returns:
+            frames (list of tuple): (name, samples, percent) for each
+                    frame, the most frequent first.
+
+        """
+        totals = Counter()
+        for stack, number in self.stacks.items():
+            for name in set(stack.split(";")):
+                if name.startswith(modules):
+                    totals[name] += number
+
+        return [(name, number, 100.0 * number / self.samples)
+                for name, number in totals.most_common(count)]
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+"""
+Database query budget and N+1 detection.
+
+When `QUERY_DEBUG` is set, the ORM queries of every command and menu
+node are counted and timed.  A command going over `QUERY_BUDGET`
+queries, or repeating the same query shape (its SQL without the
+literal values) `QUERY_REPEAT_THRESHOLD` times or more, is logged in
+the 'query' logger with the fingerprints at fault.  The `stats/queries`
+command shows the totals by command.
+
+Queries are read from Django's query log, which is filled when
+`connection.force_debug_cursor` is set, even if `DEBUG` is not.
+
+The same watch can be used as a regression guard in tests:
+
+>>> from world.querywatch import query_budget
+>>> with query_budget(5, repeat=3):
+...     caller.execute_cmd("who")
+
+It raises `QueryBudgetExceeded` if the budget isn't respected.  Such
+watches aren't counted in the reports of `stats/queries`.
+
+"""
+
+from collections import Counter
+import re
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from world.log import query as log
+
+## Constants
+QUERY_DEBUG = getattr(settings, "QUERY_DEBUG", False)
+QUERY_BUDGET = getattr(settings, "QUERY_BUDGET", 20)
+QUERY_REPEAT_THRESHOLD = getattr(settings, "QUERY_REPEAT_THRESHOLD", 5)
+RE_STRING = re.compile(r"'(?:[^']|'')*'")
+RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+RE_IN = re.compile(r"\bIN \(\?(?:\s*,\s*\?)*\)", re.I)
+RE_SPACES = re.compile(r"\s+")
+
+reports = {}
+_watching = 0
+
+def fingerprint(sql):
+    """
+    Return the shape of a SQL query, without its literal values.
+
+    Args:
+        sql (str): the SQL query.
+
+    Returns:
+        fingerprint (str): the query with its strings and numbers
+                replaced by '?' and its IN lists collapsed.
+
+    """
+    sql = RE_STRING.sub("?", sql)
+    sql = RE_NUMBER.sub("?", sql)
+    sql = RE_IN.sub("IN (...)", sql)
+    return RE_SPACES.sub(" ", sql).strip()
+
+def watch_queries(label):
+    """
+    Start watching queries if `QUERY_DEBUG` is set.
+
+    Args:
+        label (str): the label of the watch, like 'look'.
+
+    Returns:
+        watch (QueryWatch or None): the started watch, to be stopped
+                by the caller, or None if query debugging is disabled.
+
+    """
+    if not QUERY_DEBUG:
+        return None
+
+    return QueryWatch(label).start()
+
+def query_budget(budget=QUERY_BUDGET, repeat=QUERY_REPEAT_THRESHOLD, label="test"):
+    """
+    Return a watch raising `QueryBudgetExceeded` when it's not respected.
+
+    This is meant to be used in a `with` statement in tests, and
+    works whether `QUERY_DEBUG` is set or not.
+
+    Args:
+        budget (int, optional): the maximum number of queries.
+        repeat (int, optional): the number of times a query shape
+                can't be repeated.
+        label (str, optional): the label of the watch.
+
+    """
+    return QueryWatch(label, budget, repeat, strict=True)
+
+
+class QueryBudgetExceeded(AssertionError):
+
+    """Raised by a strict watch going over its budget."""
+
+    pass
+
+
+class QueryReport(object):
+
+    """The totals of the watches sharing a label."""
+
+    __slots__ = ("label", "runs", "queries", "time", "max", "flagged", "fingerprints")
+
+    def __init__(self, label):
+        self.label = label
+        self.runs = 0
+        self.queries = 0
+        self.time = 0.0
+        self.max = 0
+        self.flagged = 0
+        self.fingerprints = []
+
+
+class QueryWatch(object):
+
+    """
+    Count and time the queries run between `start` and `stop`.
+
+    Watches can be nested (a menu node in a command, for instance):
+    each one sees all the queries run since it started.
+
+    """
+
+    def __init__(self, label, budget=QUERY_BUDGET, repeat=QUERY_REPEAT_THRESHOLD,
+            strict=False):
+        self.label = label
+        self.budget = budget
+        self.repeat = repeat
+        self.strict = strict
+        self.last = None
+        self.started = None
+        self.count = 0
+        self.time = 0.0
+        self.repeated = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        if self.strict and exc_type is None and self.flagged:
+            raise QueryBudgetExceeded(self.describe())
+
+    @property
+    def over_budget(self):
+        """Return whether the watch went over its budget."""
+        return bool(self.budget) and self.count > self.budget
+
+    @property
+    def flagged(self):
+        """Return whether the watch went over its budget or repeated queries."""
+        return self.over_budget or bool(self.repeated)
+
+    def start(self):
+        """Start watching queries."""
+        global _watching
+        log_queries = connection.queries_log
+        self.last = log_queries[-1] if log_queries else None
+        self.started = time.time()
+        _watching += 1
+        connection.force_debug_cursor = True
+        return self
+
+    def stop(self):
+        """
+        Stop watching queries and report them.
+
+        Returns:
+            watch (QueryWatch): the watch itself.
+
+        """
+        global _watching
+        if self.started is None:
+            return self
+
+        _watching = max(_watching - 1, 0)
+        if not _watching:
+            connection.force_debug_cursor = False
+
+        # Read the log backward, until the last query before the start
+        queries = []
+        for query in reversed(connection.queries_log):
+            if query is self.last:
+                break
+            queries.append(query)
+
+        queries.reverse()
+        duration = time.time() - self.started
+        self.started = None
+        self.count = len(queries)
+        self.time = sum(float(query["time"]) for query in queries)
+        shapes = Counter(fingerprint(query["sql"]) for query in queries)
+        self.repeated = [(shape, number) for shape, number in shapes.most_common()
+                if self.repeat and number >= self.repeat]
+
+        if self.strict:
+            # Budget-only watches (in tests) aren't counted in the reports
+            return self
+
+        report = reports.get(self.label)
+        if report is None:
+            report = reports[self.label] = QueryReport(self.label)
+
+        report.runs += 1
+        report.queries += self.count
+        report.time += self.time
+        report.max = max(report.max, self.count)
+        if self.flagged:
+            report.flagged += 1
+            report.fingerprints = self.repeated or shapes.most_common(3)
+            log.warning("{} ({:.3f}s)".format(self.describe(), duration))
+
+        return self
+
+    def describe(self):
+        """Return a description of the queries, with the repeated shapes."""
+        lines = ["{}: {} queries in {:.3f}s".format(self.label, self.count, self.time)]
+        if self.over_budget:
+            lines[0] += " (budget {})".format(self.budget)
+
+        for shape, number in self.repeated:
+            lines.append("  {} times: {}".format(number, shape))
+
+        return "\n".join(lines)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cached rendering of the text sent to telnet clients.
+
+The telnet protocol parses the ANSI markup of every message, and
+strips it again with `SCREENREADER_REGEX_STRIP` for screenreader
+clients.  Most messages repeat (table borders, menu texts, channel
+prefixes), so the rendered text is kept in a bounded LRU cache, keyed
+by the raw text and the client profile (screenreader, colors).
+
+Sessions render their text with the cache and send it raw (with the
+`RAW_OPTIONS` options), so the portal doesn't parse it again (see
+`server/conf/serversession.py`).  Text sent with options changing its
+rendering (`RENDER_OPTIONS`) is left to the portal.
+
+Example:
+
+>>> from world.render import RENDER, get_profile
+>>> RENDER.render("|rHello|n", get_profile(session))
+
+"""
+
+from collections import OrderedDict
+import re
+
+from django.conf import settings
+from evennia.utils.ansi import parse_ansi
+
+from world.metrics import counter
+from world.snapshot import register
+
+## Constants
+RENDER_CACHE_SIZE = getattr(settings, "RENDER_CACHE_SIZE", 2048)
+RENDER_CACHE_MAX_LENGTH = 4096
+RENDER_VERSION = 1
+RENDERED_PROTOCOLS = ("telnet", "telnet/ssl")
+INLINEFUNC_ENABLED = getattr(settings, "INLINEFUNC_ENABLED", False)
+RE_SCREENREADER = re.compile(settings.SCREENREADER_REGEX_STRIP)
+RE_N = re.compile(r"\|n$")
+RENDER_OPTIONS = ("ansi", "mxp", "nocolor", "noxterm256", "raw", "screenreader",
+        "send_prompt", "xterm256")
+RAW_OPTIONS = {"raw": True, "screenreader": False}
+
+def get_profile(session):
+    """
+    Return the rendering profile of a session.
+
+    Flags are read as the telnet protocol reads them.  Text can't be
+    rendered here if inline functions are enabled, since raw text
+    isn't parsed for them.
+
+    Args:
+        session (Session): the session.
+
+    Returns:
+        profile (tuple or None): (screenreader, nocolor, xterm256), or
+                None if the text of this session can't be rendered here.
+
+    """
+    if INLINEFUNC_ENABLED or session.protocol_key not in RENDERED_PROTOCOLS:
+        return None
+
+    flags = session.protocol_flags
+    if flags.get("MXP") or flags.get("RAW"):
+        return None
+
+    ttype = flags.get("TTYPE", False)
+    xterm256 = flags.get("XTERM256", False) if ttype else True
+    ansi = flags.get("ANSI", False) if ttype else True
+    nocolor = bool(flags.get("NOCOLOR") or not (xterm256 or ansi))
+    return (bool(flags.get("SCREENREADER")), nocolor, bool(xterm256))
+
+
+class RenderCache(object):
+
+    """A bounded LRU cache of rendered texts."""
+
+    def __init__(self, size=RENDER_CACHE_SIZE):
+        self.size = size
+        self.cache = OrderedDict()
+        self.hits = counter("render_cache_hits", "Texts found in the render cache")
+        self.misses = counter("render_cache_misses", "Texts rendered")
+
+    def __len__(self):
+        return len(self.cache)
+
+    def render(self, text, profile):
+        """
+        Return a text rendered for a client profile.
+
+        Args:
+            text (str): the text with ANSI markup.
+            profile (tuple): the profile, see `get_profile`.
+
+        Returns:
+            rendered (str): the text ready to be sent to the client.
+
+        """
+        key = (text, profile)
+        rendered = self.cache.pop(key, None)
+        if rendered is not None:
+            self.hits.incr()
+            self.cache[key] = rendered
+            return rendered
+
+        self.misses.incr()
+        rendered = self.parse(text, profile)
+        if len(text) <= RENDER_CACHE_MAX_LENGTH:
+            if len(self.cache) >= self.size:
+                self.cache.popitem(last=False)
+
+            self.cache[key] = rendered
+
+        return rendered
+
+    def parse(self, text, profile):
+        """Render a text as the telnet protocol does."""
+        screenreader, nocolor, xterm256 = profile
+        if screenreader:
+            text = parse_ansi(text, strip_ansi=True, xterm256=False, mxp=False)
+            text = RE_SCREENREADER.sub("", text)
+
+        # Kill the color at the end, to match the webclient output
+        text = RE_N.sub("", text) + ("||n" if text.endswith("|") else "|n")
+        return parse_ansi(text, strip_ansi=nocolor, xterm256=xterm256, mxp=False)
+
+    def clear(self):
+        """Empty the cache."""
+        self.cache.clear()
+
+    def snapshot(self):
+        """Return the rendered texts, to keep them across reloads."""
+        return list(self.cache.items())
+
+    def restore(self, items):
+        """Restore rendered texts, the most recently used last."""
+        for key, rendered in items[-self.size:]:
+            self.cache[tuple(key)] = rendered
+
+
+RENDER = RenderCache()
+
+# The rendered texts depend on the stripping of screenreader output
+register("render", RENDER.snapshot, RENDER.restore,
+        version=(RENDER_VERSION, RE_SCREENREADER.pattern))
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fair scheduling of the input of sessions.
+
+Without scheduling, commands run in the order they arrive: a client
+pasting hundreds of lines delays everyone else.  `InputScheduler`
+keeps one queue per session and drains the queues in turn, one input
+per session, running at most `INPUT_TICK_BUDGET` inputs before
+letting the reactor handle other events.
+
+Each session also has a token bucket limiting the number of inputs
+per second, depending on the permissions of its account (see
+`INPUT_RATE_LIMITS`).  Input beyond the limit isn't refused, it waits
+in the queue, unless the queue is full (`INPUT_QUEUE_SIZE`).
+
+When the session has no waiting input and is within its limit, its
+input runs right away, even if other sessions have waiting input.  The
+scheduler is used by the `text` input function (see
+`server/conf/inputfuncs.py`).  The limit of a session is read again
+when it logs in or puppets a character, and its state is dropped when
+it disconnects (see `forget_limit` and `forget`).
+
+"""
+
+from collections import deque
+import time
+
+from django.conf import settings
+from evennia.utils.logger import log_trace
+from twisted.internet import reactor
+
+from world.metrics import counter, gauge, histogram
+from world.throttle import TokenBuckets
+
+## Constants
+INPUT_TICK_BUDGET = getattr(settings, "INPUT_TICK_BUDGET", 50)
+INPUT_QUEUE_SIZE = getattr(settings, "INPUT_QUEUE_SIZE", 100)
+INPUT_RATE_LIMITS = getattr(settings, "INPUT_RATE_LIMITS", (
+        ("Admin", None), ("Builder", (10, 40)), ("Player", (5, 20))))
+INPUT_RATE_UNLOGGED = getattr(settings, "INPUT_RATE_UNLOGGED", (2, 10))
+INPUT_RETRY_DELAY = 0.1
+INPUT_LIMIT_TTL = 60
+
+class InputScheduler(object):
+
+    """
+    Per-session input queues drained in round-robin.
+
+    Sessions with waiting input are kept in a ring: each turn takes
+    the session at the head of the ring, runs its oldest input and
+    puts the session back at the end if it has more.  Sessions over
+    their rate limit are skipped until their bucket is refilled.
+
+    """
+
+    def __init__(self, budget=INPUT_TICK_BUDGET, queue_size=INPUT_QUEUE_SIZE,
+            limits=INPUT_RATE_LIMITS, unlogged=INPUT_RATE_UNLOGGED):
+        self.budget = budget
+        self.queue_size = queue_size
+        self.limits = limits
+        self.unlogged = unlogged
+        self.queues = {}
+        self.ring = deque()
+        self.buckets = TokenBuckets(4096, unlogged[0], unlogged[1])
+        self.session_limits = {}
+        self.throttled = set()
+        self.overflowing = set()
+        self.call = None
+        self.depth = gauge("input_queue_depth", "Inputs waiting to be run")
+        self.wait = histogram("input_wait_seconds", "Time spent by inputs in the queue")
+        self.throttled_sessions = counter("input_throttled",
+                "Sessions reaching their input rate limit")
+        self.dropped = counter("input_dropped", "Inputs dropped because the queue was full")
+
+    def __len__(self):
+        return self.depth.value
+
+    def submit(self, session, function, *args, **kwargs):
+        """
+        Run or queue input from a session.
+
+        Args:
+            session (Session): the session sending input.
+            function (callable): the function handling the input,
+                    called with the session, args and kwargs.
+
+        """
+        now = time.time()
+        sessid = session.sessid
+        queue = self.queues.get(sessid)
+        if queue is None:
+            if self.allow(session, now):
+                self.run(session, function, args, kwargs)
+                return
+
+            queue = self.queues[sessid] = deque()
+            self.ring.append(sessid)
+        elif len(queue) >= self.queue_size:
+            self.dropped.incr()
+            if sessid not in self.overflowing:
+                self.overflowing.add(sessid)
+                session.msg("|rTrop de commandes en attente, les suivantes sont ignorées.|n")
+            return
+
+        queue.append((session, now, function, args, kwargs))
+        self.depth.set(self.depth.value + 1)
+        self.schedule(0)
+
+    def schedule(self, delay):
+        """Schedule a drain of the queues, if not done yet."""
+        if self.call is None or not self.call.active():
+            self.call = reactor.callLater(delay, self.drain)
+
+    def drain(self):
+        """
+        Run queued input in round-robin, within the tick budget.
+
+        If input remains, another drain is scheduled: right away if
+        the budget was spent, after `INPUT_RETRY_DELAY` if all the
+        waiting sessions are over their rate limit.
+
+        """
+        self.call = None
+        budget = self.budget
+        skipped = 0
+        now = time.time()
+        while self.ring and budget > 0 and skipped < len(self.ring):
+            sessid = self.ring.popleft()
+            queue = self.queues[sessid]
+            session, stamp, function, args, kwargs = queue[0]
+            if not self.allow(session, now):
+                self.ring.append(sessid)
+                skipped += 1
+                continue
+
+            skipped = 0
+            budget -= 1
+            queue.popleft()
+            self.depth.set(self.depth.value - 1)
+            if queue:
+                self.ring.append(sessid)
+            else:
+                del self.queues[sessid]
+                self.overflowing.discard(sessid)
+
+            self.wait.record(now - stamp)
+            self.run(session, function, args, kwargs)
+
+        if self.ring:
+            self.schedule(0 if budget <= 0 else INPUT_RETRY_DELAY)
+
+    def run(self, session, function, args, kwargs):
+        """Run input, if the session is still connected."""
+        from evennia.server.sessionhandler import SESSIONS
+        if SESSIONS.get(session.sessid) is not session:
+            return
+
+        try:
+            function(session, *args, **kwargs)
+        except Exception:
+            log_trace("Error while handling input of {}".format(session))
+
+    def allow(self, session, now=None):
+        """
+        Take a token from the bucket of a session.
+
+        Args:
+            session (Session): the session.
+            now (float, optional): the current time.
+
+        Returns:
+            allowed (bool): whether the session is within its rate limit.
+
+        """
+        limit = self.get_limit(session, now)
+        if limit is None:
+            return True
+
+        sessid = session.sessid
+        if self.buckets.allow(sessid, 1, limit[0], limit[1], now):
+            self.throttled.discard(sessid)
+            return True
+
+        if sessid not in self.throttled:
+            self.throttled.add(sessid)
+            self.throttled_sessions.incr()
+
+        return False
+
+    def forget_limit(self, session):
+        """Read the rate limit of a session again at its next input."""
+        self.session_limits.pop(session.sessid, None)
+
+    def forget(self, session):
+        """
+        Drop the waiting input and the state of a session.
+
+        Args:
+            session (Session): the disconnected session.
+
+        """
+        sessid = session.sessid
+        queue = self.queues.pop(sessid, None)
+        if queue is not None:
+            self.ring.remove(sessid)
+            self.depth.set(self.depth.value - len(queue))
+
+        self.session_limits.pop(sessid, None)
+        self.throttled.discard(sessid)
+        self.overflowing.discard(sessid)
+
+    def get_limit(self, session, now=None):
+        """
+        Return the rate limit of a session.
+
+        The limit depends on the permissions of the account, and is
+        kept for `INPUT_LIMIT_TTL` seconds, or until the session logs
+        in or puppets a character.
+
+        Args:
+            session (Session): the session.
+            now (float, optional): the current time.
+
+        Returns:
+            limit (tuple or None): (inputs per second, burst), or None
+                    if the session isn't limited.
+
+        """
+        now = time.time() if now is None else now
+        cached = self.session_limits.get(session.sessid)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        limit = self.unlogged
+        account = session.account if session.logged_in else None
+        if account:
+            for permission, value in self.limits:
+                if account.locks.check_lockstring(account, "perm({})".format(permission)):
+                    limit = value
+                    break
+
+        if len(self.session_limits) > self.buckets.size:
+            self.session_limits = dict((sessid, cached) for sessid, cached in
+                    self.session_limits.items() if cached[1] > now)
+
+        self.session_limits[session.sessid] = (limit, now + INPUT_LIMIT_TTL)
+        return limit
+
+
+INPUT = InputScheduler()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+Snapshot of in-memory caches across reloads.
+
+A reload restarts the server process: everything kept in memory is
+lost, and caches have to be filled again while players are playing.
+Modules register their caches with a function returning their data
+(only builtin types: strings, numbers, tuples, lists, dicts) and a
+function restoring it:
+
+>>> from world.snapshot import register
+>>> register("render", RENDER.snapshot, RENDER.restore, version=1)
+
+The caches are saved in `SNAPSHOT_FILE` when the server stops for a
+reload, and restored when it starts again (see
+`server/conf/at_server_startstop.py`).  The file is only read once.
+
+Each cache has a version, to be changed when the format of its data
+(or the meaning of what it caches) changes: data saved with another
+version is dropped, as is a snapshot older than `SNAPSHOT_MAX_AGE`
+seconds or written in another file format.
+
+"""
+
+from collections import OrderedDict
+import cPickle as pickle
+import os
+import time
+
+from django.conf import settings
+
+## Constants
+SNAPSHOT_FILE = getattr(settings, "SNAPSHOT_FILE",
+        os.path.join(settings.GAME_DIR, "server", "snapshot.pickle"))
+SNAPSHOT_MAX_AGE = getattr(settings, "SNAPSHOT_MAX_AGE", 600)
+SNAPSHOT_FORMAT = 1
+
+caches = OrderedDict()
+
+def register(name, save, restore, version=1):
+    """
+    Register a cache to be saved across reloads.
+
+    Args:
+        name (str): the name of the cache, unique.
+        save (callable): called without argument, returns the data.
+        restore (callable): called with the data to restore the cache.
+        version (hashable, optional): the version of the data format.
+
+    """
+    caches[name] = (version, save, restore)
+
+def save_snapshot(path=SNAPSHOT_FILE):
+    """
+    Save the registered caches.
+
+    A cache failing to save is logged and skipped.  If the snapshot
+    can't be written, the error is logged and nothing is saved: this
+    function doesn't raise, so that the server can stop.
+
+    Args:
+        path (str, optional): the path of the snapshot file.
+
+    Returns:
+        saved (list of str): the names of the saved caches.
+
+    """
+    from world.log import main as log
+    started = time.time()
+    data = {}
+    for name, (version, save, restore) in caches.items():
+        try:
+            data[name] = (version, save())
+        except Exception:
+            log.exception("Snapshot: can't save the {} cache".format(name))
+
+    snapshot = {"format": SNAPSHOT_FORMAT, "time": time.time(), "caches": data}
+    temporary = path + ".tmp"
+    try:
+        with open(temporary, "wb") as file:
+            pickle.dump(snapshot, file, pickle.HIGHEST_PROTOCOL)
+        os.rename(temporary, path)
+    except Exception:
+        log.exception("Snapshot: can't write {}, nothing saved".format(path))
+        discard_snapshot(temporary)
+        return []
+
+    log.info("Snapshot: {} saved in {:.3f}s".format(", ".join(sorted(data)) or "nothing",
+            time.time() - started))
+    return sorted(data)
+
+def restore_snapshot(path=SNAPSHOT_FILE, max_age=SNAPSHOT_MAX_AGE):
+    """
+    Restore the registered caches, and remove the snapshot file.
+
+    Stale data (another format or version, or too old) is dropped.
+
+    Args:
+        path (str, optional): the path of the snapshot file.
+        max_age (float, optional): the maximum age of the snapshot,
+                in seconds.
+
+    Returns:
+        restored (list of str): the names of the restored caches.
+
+    """
+    from world.log import main as log
+    if not os.path.exists(path):
+        return []
+
+    started = time.time()
+    try:
+        with open(path, "rb") as file:
+            snapshot = pickle.load(file)
+    except Exception:
+        log.exception("Snapshot: can't read {}, dropped".format(path))
+        snapshot = {}
+    finally:
+        discard_snapshot(path)
+
+    if not isinstance(snapshot, dict) or snapshot.get("format") != SNAPSHOT_FORMAT:
+        log.warning("Snapshot: unknown format, dropped")
+        return []
+
+    age = time.time() - snapshot.get("time", 0)
+    if age > max_age:
+        log.warning("Snapshot: {:.0f}s old, dropped".format(age))
+        return []
+
+    restored = []
+    for name, (version, data) in sorted(snapshot.get("caches", {}).items()):
+        if name not in caches:
+            continue
+
+        if caches[name][0] != version:
+            log.warning("Snapshot: {} saved with version {!r} instead of {!r}, dropped".format(
+                    name, version, caches[name][0]))
+            continue
+
+        try:
+            caches[name][2](data)
+        except Exception:
+            log.exception("Snapshot: can't restore the {} cache".format(name))
+        else:
+            restored.append(name)
+
+    log.info("Snapshot: {} restored in {:.3f}s".format(", ".join(restored) or "nothing",
+            time.time() - started))
+    return restored
+
+def discard_snapshot(path=SNAPSHOT_FILE):
+    """Remove the snapshot file, if any."""
+    from world.log import main as log
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        log.exception("Snapshot: can't remove {}".format(path))
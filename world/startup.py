@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timing of the server startup.
+
+`STARTUP` measures the imports of the modules and the startup hooks,
+so that cold start and reload times can be measured.  It's started
+when `server/conf/at_server_startstop.py` is loaded, which only the
+server process does (not the portal), before the game modules are
+imported.
+
+Imports aren't timed by replacing `__import__`: a background thread
+samples the stack of the starting thread, like `python -X importtime`
+would measure it.  Each module found being executed (its '<module>'
+frame) in a sample is counted, with the modules it imports: the report
+gives the approximate time spent loading each module, including its
+own imports.  The hooks of `server/conf/at_server_startstop.py` are
+timed with `hook`, and the report is logged in 'server/logs/main.log'
+when the server has started.
+
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+import sys
+import threading
+import time
+
+## Constants
+STARTUP_SAMPLE_RATE = 500
+STARTUP_WINDOW = 300
+STARTUP_REPORT_SIZE = 15
+
+class StartupTimer(object):
+
+    """
+    Time the imports and hooks of the startup.
+
+    The sampling thread runs until the report is written, or for
+    `STARTUP_WINDOW` seconds at most.
+
+    """
+
+    def __init__(self):
+        self.started = None
+        self.ended = None
+        self.stopped = False
+        self.thread = None
+        self.ident = None
+        self.imports = Counter()
+        self.samples = 0
+        self.hooks = []
+
+    def start(self, rate=STARTUP_SAMPLE_RATE):
+        """Start sampling the imports of the current thread."""
+        if self.thread is not None:
+            return
+
+        self.started = time.time()
+        self.ident = threading.current_thread().ident
+        self.thread = threading.Thread(target=self.run, name="startup-timer",
+                args=(rate, ))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop sampling the imports."""
+        self.stopped = True
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def run(self, rate):
+        """Sample the modules being loaded, in the sampling thread."""
+        interval = 1.0 / rate
+        end = self.started + STARTUP_WINDOW
+        while not self.stopped and time.time() < end:
+            frame = sys._current_frames().get(self.ident)
+            names = set()
+            while frame is not None:
+                if frame.f_code.co_name == "<module>":
+                    names.add(frame.f_globals.get("__name__", "?"))
+                frame = frame.f_back
+
+            # The script running the process isn't an import
+            names.discard("__main__")
+            self.imports.update(names)
+            self.samples += 1
+            del frame
+            time.sleep(interval)
+
+        self.ended = time.time()
+
+    @contextmanager
+    def hook(self, name):
+        """Time a startup hook."""
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.hooks.append((name, time.time() - started))
+
+    def report(self, size=STARTUP_REPORT_SIZE):
+        """
+        Log the startup times and stop sampling.
+
+        Args:
+            size (int, optional): the number of slowest imports to show.
+
+        """
+        from world.log import main as log
+        if self.started is None:
+            return
+
+        self.stop()
+        lines = ["Server started in {:.3f}s (since the start hooks were loaded)".format(
+                time.time() - self.started)]
+        if self.imports and self.samples:
+            # Each sample stands for the same share of the sampling time
+            sample = ((self.ended or time.time()) - self.started) / self.samples
+            lines.append("Slowest imports (including their own imports, "
+                    "{} samples):".format(self.samples))
+            for name, count in self.imports.most_common(size):
+                lines.append("  {:>8.3f}s {}".format(count * sample, name))
+
+        if self.hooks:
+            lines.append("Startup hooks:")
+            for name, duration in self.hooks:
+                lines.append("  {:>8.3f}s {}".format(duration, name))
+
+        log.info("\n".join(lines))
+        self.imports.clear()
+        self.hooks = []
+
+
+STARTUP = StartupTimer()
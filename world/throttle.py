@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+Token buckets to limit the rate of actions.
+
+A token bucket holds up to `burst` tokens and is refilled with `rate`
+tokens per second.  An action costs one token and is refused when the
+bucket is empty.  `TokenBuckets` keeps a fixed number of buckets in
+preallocated arrays, so checking a limit is a dictionary lookup and a
+few arithmetic operations, whatever the number of players.
+
+`CHANNELS` is the throttle used by the channel commands, with one
+bucket per speaker on a channel and one bucket per channel.
+
+Example:
+
+>>> from world.throttle import CHANNELS
+>>> if not CHANNELS.allow(caller, "hrp"):
+...     # Refuse to send the message
+
+"""
+
+from array import array
+import time
+
+from django.conf import settings
+
+from world.metrics import counter
+
+## Constants
+CHANNEL_THROTTLE_SPEAKER = getattr(settings, "CHANNEL_THROTTLE_SPEAKER", (20, 5))
+CHANNEL_THROTTLE_CHANNEL = getattr(settings, "CHANNEL_THROTTLE_CHANNEL", (120, 20))
+
+class TokenBuckets(object):
+
+    """
+    A fixed number of token buckets in preallocated arrays.
+
+    Each bucket is identified by a hashable key and stored in a slot.
+    Keys receive a slot when they are first checked.  When all slots
+    are taken, slots are reused in turn (the evicted key will get a
+    full bucket if it comes back).
+
+    """
+
+    def __init__(self, size, rate, burst):
+        self.size = size
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = array("d", [0.0]) * size
+        self.stamps = array("d", [0.0]) * size
+        self.keys = [None] * size
+        self.slots = {}
+        self.hand = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def allow(self, key, cost=1, rate=None, burst=None, now=None):
+        """
+        Take tokens from a bucket, returning whether it was possible.
+
+        Args:
+            key (hashable): the key of the bucket.
+            cost (float, optional): the number of tokens to take.
+            rate (float, optional): the refill rate (tokens per second)
+                    of this bucket, the default rate if None.
+            burst (float, optional): the capacity of this bucket, the
+                    default capacity if None.
+            now (float, optional): the current time.
+
+        Returns:
+            allowed (bool): True if the bucket had enough tokens.
+
+        """
+        rate = self.rate if rate is None else rate
+        burst = self.burst if burst is None else burst
+        now = time.time() if now is None else now
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self._assign(key)
+            tokens = burst
+        else:
+            tokens = self.tokens[slot] + (now - self.stamps[slot]) * rate
+            if tokens > burst:
+                tokens = burst
+
+        self.stamps[slot] = now
+        if tokens >= cost:
+            self.tokens[slot] = tokens - cost
+            return True
+
+        self.tokens[slot] = tokens
+        return False
+
+    def refund(self, key, cost=1, burst=None):
+        """
+        Give back tokens taken from a bucket.
+
+        Args:
+            key (hashable): the key of the bucket.
+            cost (float, optional): the number of tokens to give back.
+            burst (float, optional): the capacity of this bucket, the
+                    default capacity if None.
+
+        """
+        burst = self.burst if burst is None else burst
+        slot = self.slots.get(key)
+        if slot is not None:
+            self.tokens[slot] = min(self.tokens[slot] + cost, burst)
+
+    def forget(self, key):
+        """Free the slot of a key, if any."""
+        slot = self.slots.pop(key, None)
+        if slot is not None:
+            self.keys[slot] = None
+
+    def _assign(self, key):
+        """Give a slot to a new key, reusing slots in turn if needed."""
+        slot = self.hand
+        self.hand = (slot + 1) % self.size
+        previous = self.keys[slot]
+        if previous is not None:
+            del self.slots[previous]
+
+        self.keys[slot] = key
+        self.slots[key] = slot
+        return slot
+
+
+class ChannelThrottle(object):
+
+    """
+    Rate limits for channel messages.
+
+    Each speaker on a channel and each channel have their own bucket.
+    Limits are given in messages per minute with a burst (the number
+    of messages that can be sent at once), and can be changed per channel.
+
+    """
+
+    def __init__(self, speaker=CHANNEL_THROTTLE_SPEAKER,
+            channel=CHANNEL_THROTTLE_CHANNEL, size=4096):
+        self.default = tuple(speaker) + tuple(channel)
+        self.limits = {}
+        self.speakers = TokenBuckets(size, speaker[0] / 60.0, speaker[1])
+        self.channels = TokenBuckets(256, channel[0] / 60.0, channel[1])
+        self.counters = {}
+
+    def get_limits(self, channel):
+        """
+        Return the limits of a channel.
+
+        Args:
+            channel (str): the channel key.
+
+        Returns:
+            limits (tuple): (speaker rate, speaker burst, channel rate,
+                    channel burst), rates being in messages per minute.
+
+        """
+        return self.limits.get(channel.lower(), self.default)
+
+    def configure(self, channel, limits=None):
+        """
+        Change the limits of a channel.
+
+        Args:
+            channel (str): the channel key.
+            limits (tuple, optional): (speaker rate, speaker burst,
+                    channel rate, channel burst), rates being in
+                    messages per minute.  Restore the default limits if None.
+
+        """
+        channel = channel.lower()
+        if limits is None or tuple(limits) == self.default:
+            self.limits.pop(channel, None)
+        else:
+            self.limits[channel] = tuple(limits)
+
+    def allow(self, speaker, channel):
+        """
+        Return whether a speaker can send a message to a channel.
+
+        The throttle events are counted.  A message refused by the
+        channel bucket doesn't cost a token to the speaker.
+
+        Args:
+            speaker (Object or Account): the speaker.
+            channel (str): the channel key.
+
+        Returns:
+            allowed (bool): True if the message can be sent.
+
+        """
+        channel = channel.lower()
+        limits = self.limits.get(channel, self.default)
+        key = (type(speaker).__name__, speaker.id, channel)
+        if not self.speakers.allow(key, 1, limits[0] / 60.0, limits[1]):
+            self.get_counter(channel, "speaker").incr()
+            return False
+
+        if not self.channels.allow(channel, 1, limits[2] / 60.0, limits[3]):
+            self.speakers.refund(key, 1, limits[1])
+            self.get_counter(channel, "channel").incr()
+            return False
+
+        return True
+
+    def get_counter(self, channel, scope):
+        """Return the throttle counter of a channel for a scope."""
+        key = (channel, scope)
+        if key not in self.counters:
+            self.counters[key] = counter("channel_throttled",
+                    "Channel messages refused by the throttle",
+                    channel=channel, scope=scope)
+
+        return self.counters[key]
+
+
+CHANNELS = ChannelThrottle()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk warm-up of the caches when the server starts.
+
+Objects are kept in memory by the idmapper once loaded, but after a
+start the first players to connect load the rooms, exits, channels and
+accounts one query at a time.  The warm-up loads this working set in a
+few bulk queries, before players can send commands:
+
+- channels: the channels of `DEFAULT_CHANNELS`.
+- rooms: all rooms, with their description.
+- exits: all exits.
+- accounts: the accounts logged in during the last
+  `WARMUP_RECENT_DAYS` days (at most `WARMUP_LIMIT`).
+- characters: the playable characters of these accounts.
+
+The stages to run are set by `WARMUP_STAGES` (empty to disable the
+warm-up).  It's called in `server/conf/at_server_startstop.py`, and its
+duration is logged in 'server/logs/main.log'.
+
+"""
+
+from collections import OrderedDict
+from datetime import timedelta
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from world.attributes import prefetch_attributes
+from world.log import main as log
+
+## Constants
+WARMUP_STAGES = getattr(settings, "WARMUP_STAGES", (
+        "channels", "rooms", "exits", "accounts", "characters"))
+WARMUP_RECENT_DAYS = getattr(settings, "WARMUP_RECENT_DAYS", 7)
+WARMUP_LIMIT = getattr(settings, "WARMUP_LIMIT", 500)
+WARMUP_ROOM_ATTRIBUTES = ("desc", )
+PACKED_DBOBJ = "__packed_dbobj__"
+
+def warm_channels(loaded):
+    """Load the default channels."""
+    from evennia.comms.models import ChannelDB
+    keys = [channel["key"] for channel in getattr(settings, "DEFAULT_CHANNELS", [])]
+    return list(ChannelDB.objects.filter(db_key__in=keys))
+
+def warm_rooms(loaded):
+    """Load the rooms and their description."""
+    from typeclasses.rooms import Room
+    rooms = list(Room.objects.all_family())
+    prefetch_attributes(rooms, WARMUP_ROOM_ATTRIBUTES)
+    return rooms
+
+def warm_exits(loaded):
+    """Load the exits."""
+    from typeclasses.exits import Exit
+    return list(Exit.objects.all_family())
+
+def warm_accounts(loaded):
+    """Load the recently active accounts."""
+    from typeclasses.accounts import Account
+    since = timezone.now() - timedelta(days=WARMUP_RECENT_DAYS)
+    accounts = Account.objects.filter_family(last_login__gte=since)
+    return list(accounts.order_by("-last_login")[:WARMUP_LIMIT])
+
+def warm_characters(loaded):
+    """
+    Load the playable characters of the accounts loaded before.
+
+    The '_playable_characters' attribute of the accounts is loaded in
+    one query.  Its stored value refers to the characters by id: they
+    are loaded in one query too, so reading the attribute afterward
+    finds them in the idmapper cache.
+
+    """
+    from evennia.objects.models import ObjectDB
+    accounts = loaded.get("accounts", [])
+    prefetch_attributes(accounts, ["_playable_characters", "_last_puppet"])
+    ids = set()
+    for account in accounts:
+        for key in ("_playable_characters", "_last_puppet"):
+            attribute = account.attributes._cache.get("%s-None" % key.lower())
+            if attribute is not None:
+                ids.update(get_packed_ids(attribute.db_value))
+
+    return list(ObjectDB.objects.filter(id__in=ids)) if ids else []
+
+def get_packed_ids(value):
+    """
+    Return the ids of the objects in a stored attribute value.
+
+    Stored values refer to database objects with a packed tuple (see
+    `evennia.utils.dbserialize`): ('__packed_dbobj__', ('objects',
+    'objectdb'), date, id).
+
+    """
+    ids = []
+    if isinstance(value, (tuple, list)):
+        if len(value) == 4 and value[0] == PACKED_DBOBJ:
+            if tuple(value[1]) == ("objects", "objectdb"):
+                ids.append(value[3])
+        else:
+            for item in value:
+                ids.extend(get_packed_ids(item))
+
+    return ids
+
+STAGES = OrderedDict((
+    ("channels", warm_channels),
+    ("rooms", warm_rooms),
+    ("exits", warm_exits),
+    ("accounts", warm_accounts),
+    ("characters", warm_characters),
+))
+
+def warm_up(stages=WARMUP_STAGES):
+    """
+    Load the working set in memory, stage by stage.
+
+    A failing stage is logged and skipped.
+
+    Args:
+        stages (list of str, optional): the stages to run, in order.
+
+    Returns:
+        loaded (dict): the objects loaded by each stage.
+
+    """
+    loaded = {}
+    timings = []
+    started = time.time()
+    for name in stages:
+        stage = STAGES.get(name)
+        if stage is None:
+            log.warning("Warm-up: unknown stage {!r}".format(name))
+            continue
+
+        before = time.time()
+        try:
+            loaded[name] = stage(loaded)
+        except Exception:
+            log.exception("Warm-up: the {} stage failed".format(name))
+            continue
+
+        timings.append("{} {} in {:.3f}s".format(len(loaded[name]), name,
+                time.time() - before))
+
+    if timings:
+        log.info("Warm-up in {:.3f}s: {}".format(time.time() - started,
+                ", ".join(timings)))
+
+    return loaded
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+Watchdog of the reactor lag.
+
+A blocking call (sending an email, hashing a password, running git)
+stops the reactor: no other player is served until it returns.  The
+watchdog measures this lag with a heartbeat called by the reactor every
+`LAG_INTERVAL` seconds: the lag is the delay of the heartbeat, recorded
+in the 'reactor_lag_seconds' histogram.
+
+A watchdog thread checks the heartbeat.  If the reactor didn't beat for
+`LAG_THRESHOLD` seconds, the thread captures the stack of the reactor
+thread while it's still blocked, and logs it in 'server/logs/lag.log',
+so the blocking call can be found.
+
+The service is started in `server/conf/server_services_plugins.py`.
+
+"""
+
+import sys
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from twisted.application.internet import TimerService
+
+from world.log import lag as log
+from world.metrics import counter, gauge, histogram
+
+## Constants
+LAG_INTERVAL = getattr(settings, "LAG_INTERVAL", 0.05)
+LAG_THRESHOLD = getattr(settings, "LAG_THRESHOLD", 0.5)
+
+class LagWatchdog(object):
+
+    """
+    Heartbeat of the reactor, and the thread watching it.
+
+    `beat` is called by the reactor.  The watchdog thread runs while
+    the watchdog is started, and reports each stall once.
+
+    """
+
+    def __init__(self, interval=LAG_INTERVAL, threshold=LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.last = None
+        self.ident = None
+        self.reported = None
+        self.thread = None
+        self.running = False
+        self.lag = gauge("reactor_lag", "Last delay of the reactor heartbeat")
+        self.lags = histogram("reactor_lag_seconds", "Delay of the reactor heartbeat")
+        self.stalls = counter("reactor_stalls", "Reactor blocked longer than the threshold")
+
+    def start(self):
+        """Start the watchdog thread."""
+        self.running = True
+        self.last = None
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.watch, name="lag-watchdog")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        """Stop watching (the thread ends on its next check)."""
+        self.running = False
+        self.last = None
+
+    def beat(self):
+        """Record the delay of the heartbeat, in the reactor thread."""
+        now = time.time()
+        self.ident = threading.current_thread().ident
+        if self.last is not None:
+            delay = max(now - self.last - self.interval, 0)
+            self.lag.set(delay)
+            self.lags.record(delay)
+            if delay >= self.threshold:
+                self.stalls.incr()
+                log.warning("Reactor blocked for {:.3f}s".format(delay))
+
+        self.last = now
+
+    def watch(self):
+        """Check the heartbeat, in the watchdog thread."""
+        while self.running:
+            time.sleep(self.interval)
+            last = self.last
+            if last is None or last == self.reported:
+                continue
+
+            if time.time() - last >= self.threshold:
+                self.reported = last
+                self.capture(time.time() - last)
+
+    def capture(self, blocked):
+        """Log the stack of the blocked reactor thread."""
+        frame = sys._current_frames().get(self.ident)
+        if frame is None:
+            return
+
+        stack = "".join(traceback.format_stack(frame))
+        log.warning("Reactor blocked for {:.3f}s so far, in:\n{}".format(
+                blocked, stack.rstrip()))
+
+
+class LagService(TimerService):
+
+    """A service calling the heartbeat and running the watchdog thread."""
+
+    def __init__(self, watchdog):
+        TimerService.__init__(self, watchdog.interval, watchdog.beat)
+        self.watchdog = watchdog
+
+    def startService(self):
+        TimerService.startService(self)
+        self.watchdog.start()
+
+    def stopService(self):
+        self.watchdog.stop()
+        return TimerService.stopService(self)
+
+
+LAG = LagWatchdog()